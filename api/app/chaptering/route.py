@@ -1,28 +1,401 @@
-from fastapi import APIRouter, UploadFile, File
-from fastapi.responses import JSONResponse
-from utils.aud_extractor import AudioExtractor
+from fastapi import APIRouter, UploadFile, File, Form, HTTPException
+from fastapi.responses import JSONResponse, StreamingResponse
 import os
-from moviepy.audio.io import AudioFileClip
-from media_analyzer.media_analyzer import analyze_video
+from media_analyzer.media_analyzer import analyze_video, rechapter_video, cached_segments
+from media_analyzer.batch import batch_analyzer
+from utils.worker_pool import worker_pool, QueueFullError
+from utils.job_store import job_store, JobProgress, JOB_FIELDS
+from utils.upload import (stream_upload_to_disk, UploadTooLargeError, resolve_local_path,
+                          hash_file, LocalPathError)
+from utils.result_cache import result_cache, make_cache_key
+from utils.video_processor import VideoProcessor
+from utils.llm_client import get_llm_client
+from utils.chapter_parser import parse_stats
+from utils.vad import vad_stats
+from utils.engines import engine_stats
+from utils.metrics import RequestTrace, span, tracing
+from typing import List, Optional
+import asyncio
 import json
-import tempfile
+import time
 
 router = APIRouter()
-# Get the absolute path of the current script
-base_dir = os.path.dirname(os.path.abspath(__file__))
+# keep references to running job tasks so they are not garbage collected
+background_jobs = set()
+
+
+async def save_upload(file: UploadFile) -> tuple:
+    """
+    Stream the uploaded file to a unique temporary location.
+    Returns (path, content hash).
+    """
+    try:
+        return await stream_upload_to_disk(file)
+    except UploadTooLargeError as e:
+        raise HTTPException(status_code=413, detail=str(e))
+
+
+def queue_full() -> HTTPException:
+    return HTTPException(status_code=503, detail="Analyzer queue is full",
+                         headers={"Retry-After": "30"})
+
+
+def cache_key(content_hash: str, streaming: bool = False) -> str:
+    return make_cache_key(content_hash, VideoProcessor(streaming=streaming).fingerprint())
+
+
+def get_cached_result(content_hash: str, use_cache: bool, refresh: bool, streaming: bool = False):
+    """
+    Return the cached analysis for this upload, or None on a miss or bypass.
+    """
+    if result_cache is None or not use_cache or refresh:
+        return None
+    return result_cache.get(cache_key(content_hash, streaming))
+
+
+def store_result(content_hash: str, result: dict, use_cache: bool, streaming: bool = False) -> None:
+    # Failed chaptering (unparseable LLM output) is not worth caching
+    if result_cache is None or not use_cache or result.get("chapters") is None:
+        return
+    # per-request timings describe this run, not the cached result
+    result = {key: value for key, value in result.items() if key != "timings"}
+    result_cache.set(cache_key(content_hash, streaming), content_hash, result)
+
+
+def replay_events(content_hash: str, result: dict) -> list:
+    """
+    The stage events of a cached streamed analysis, in the order they are
+    emitted live, so a client renders a cache hit like a fresh run.
+    """
+    events = []
+    segments = cached_segments(VideoProcessor(streaming=True), content_hash)
+    if segments is not None:
+        events.append(("segments", segments))
+    for event in ("transcript", "chapters", "alignedChapters"):
+        events.append((event, result.get(event)))
+    return events
+
+
+def with_timings(result: dict, trace: Optional[RequestTrace]) -> dict:
+    """
+    Merge the worker's timing spans into the request trace and attach the
+    combined block to a copy of the result.
+    """
+    if trace is None:
+        return result
+    trace.merge(result.get("timings"))
+    return dict(result, timings=trace.to_dict())
 
 
 @router.post("/vid-to-text")
-async def vid_to_txt(file: UploadFile = File(...)):
-    # Save the uploaded file to a temporary location
-    video_path = os.path.join(base_dir, file.filename)
-    with open(video_path, "wb") as buffer:
-        buffer.write(await file.read())
+async def vid_to_txt(file: UploadFile = File(...), cache: bool = True, refresh: bool = False,
+                     timings: bool = False):
+    # Without a cache every request needs a worker, so reject before reading the upload
+    if result_cache is None and worker_pool.is_full():
+        raise queue_full()
+
+    trace = RequestTrace() if timings else None
+    with tracing(trace), span("request"):
+        # Save the uploaded file to a temporary location
+        with span("upload"):
+            video_path, content_hash = await save_upload(file)
+
+        # Analyze the video on the worker pool so the event loop stays responsive
+        try:
+            with span("cacheLookup"):
+                chapters = await asyncio.to_thread(get_cached_result, content_hash, cache, refresh)
+            if chapters is None:
+                # a cache miss needs a worker after all
+                if worker_pool.is_full():
+                    raise queue_full()
+                chapters = await worker_pool.run(
+                    analyze_video, video_path,
+                    content_hash=content_hash if cache else None, refresh=refresh,
+                    timings=timings)
+                await asyncio.to_thread(store_result, content_hash, chapters, cache)
+        except QueueFullError as e:
+            raise HTTPException(status_code=503, detail=str(e),
+                                headers={"Retry-After": "30"})
+        finally:
+            # remove the temporary file after processing, even when analysis raises
+            os.remove(video_path)
+
+    return JSONResponse(content=with_timings(chapters, trace))
+
+
+def sse_event(event: str, data) -> str:
+    # Server-Sent Events frame; JSON never contains raw newlines
+    return f"event: {event}\ndata: {json.dumps(data)}\n\n"
+
+
+@router.post("/vid-to-text/stream")
+async def vid_to_txt_stream(file: UploadFile = File(...), cache: bool = True, refresh: bool = False,
+                            timings: bool = False):
+    """
+    Same analysis as /vid-to-text, streamed as Server-Sent Events: `segments`
+    while Whisper decodes, then `transcript`, `chapters`, `alignedChapters`
+    and finally `result` (or `error`).
+    """
+    if result_cache is None and worker_pool.is_full():
+        raise queue_full()
+
+    trace = RequestTrace() if timings else None
+    with tracing(trace):
+        with span("upload"):
+            video_path, content_hash = await save_upload(file)
+        try:
+            with span("cacheLookup"):
+                cached = await asyncio.to_thread(
+                    get_cached_result, content_hash, cache, refresh, True)
+            # reject a miss while the response can still carry the status
+            if cached is None and worker_pool.is_full():
+                raise queue_full()
+        except BaseException:
+            os.remove(video_path)
+            raise
+    loop = asyncio.get_running_loop()
+    events: asyncio.Queue = asyncio.Queue()
+
+    def emit(event: str, data) -> None:
+        # called from the worker thread
+        loop.call_soon_threadsafe(events.put_nowait, (event, data))
+
+    async def analyze():
+        try:
+            result = cached
+            if result is None:
+                result = await worker_pool.run_local(
+                    analyze_video, video_path,
+                    content_hash=content_hash if cache else None, refresh=refresh,
+                    on_event=emit, timings=timings)
+                await asyncio.to_thread(store_result, content_hash, result, cache, True)
+            else:
+                for event, data in await asyncio.to_thread(replay_events, content_hash, result):
+                    events.put_nowait((event, data))
+            events.put_nowait(("result", with_timings(result, trace)))
+        except QueueFullError as e:
+            events.put_nowait(("error", {"status": 503, "detail": str(e)}))
+        except Exception as e:
+            events.put_nowait(("error", {"status": 500, "detail": str(e)}))
+        finally:
+            os.remove(video_path)
+            events.put_nowait((None, None))
+
+    # the analysis keeps running (and fills the cache) if the client disconnects
+    task = asyncio.create_task(analyze())
+    background_jobs.add(task)
+    task.add_done_callback(background_jobs.discard)
+
+    async def stream():
+        while True:
+            event, data = await events.get()
+            if event is None:
+                break
+            yield sse_event(event, data)
+
+    return StreamingResponse(stream(), media_type="text/event-stream",
+                             headers={"Cache-Control": "no-cache", "X-Accel-Buffering": "no"})
+
+
+async def run_job(job_id: str, video_path: str, content_hash: str, use_cache: bool, refresh: bool):
+    """
+    Run the analysis for a submitted job and record the outcome in the job store.
+    """
+    try:
+        result = await worker_pool.run(
+            analyze_video, video_path, progress=JobProgress(job_id),
+            content_hash=content_hash if use_cache else None, refresh=refresh)
+        await asyncio.to_thread(store_result, content_hash, result, use_cache)
+        job_store.update(job_id, status="done", progress=1.0, result=result)
+    except Exception as e:
+        job_store.update(job_id, status="failed", error=str(e))
+    finally:
+        os.remove(video_path)
+
+
+@router.post("/jobs", status_code=202)
+async def submit_job(file: UploadFile = File(...), cache: bool = True, refresh: bool = False):
+    # Same admission control as the synchronous route
+    if result_cache is None and worker_pool.is_full():
+        raise queue_full()
+
+    video_path, content_hash = await save_upload(file)
+    scheduled = False
+    try:
+        cached = await asyncio.to_thread(get_cached_result, content_hash, cache, refresh)
+        # a queued job would only fail later, so reject the miss now
+        if cached is None and worker_pool.is_full():
+            raise queue_full()
+        job = job_store.create(filename=file.filename)
+
+        if cached is not None:
+            job_store.update(job["jobId"], status="done", progress=1.0, result=cached)
+            return {key: job_store.get(job["jobId"])[key] for key in JOB_FIELDS}
+
+        task = asyncio.create_task(run_job(job["jobId"], video_path, content_hash, cache, refresh))
+        scheduled = True
+    finally:
+        # from here on run_job owns the upload and removes it when done
+        if not scheduled:
+            os.remove(video_path)
+
+    background_jobs.add(task)
+    task.add_done_callback(background_jobs.discard)
+
+    return {key: job[key] for key in JOB_FIELDS}
+
+
+@router.get("/jobs/{job_id}")
+async def job_status(job_id: str):
+    job = job_store.get(job_id)
+    if job is None:
+        raise HTTPException(status_code=404, detail="Job not found")
+    return {key: job[key] for key in JOB_FIELDS}
+
+
+@router.get("/jobs/{job_id}/result")
+async def job_result(job_id: str):
+    job = job_store.get(job_id)
+    if job is None:
+        raise HTTPException(status_code=404, detail="Job not found")
+    if job["status"] == "failed":
+        raise HTTPException(status_code=500, detail=job["error"])
+    if job["status"] != "done":
+        raise HTTPException(status_code=409, detail=f"Job is {job['status']}")
+    return JSONResponse(content=job["result"])
+
+
+@router.delete("/jobs/{job_id}")
+async def delete_job(job_id: str):
+    if not job_store.delete(job_id):
+        raise HTTPException(status_code=404, detail="Job not found")
+    return {"jobId": job_id, "deleted": True}
+
+
+@router.post("/batch")
+async def analyze_batch(files: Optional[List[UploadFile]] = File(None),
+                        paths: Optional[List[str]] = Form(None),
+                        cache: bool = True, refresh: bool = False):
+    """
+    Analyze many videos in one request: uploaded `files` and/or server-side
+    `paths` under LOCAL_VIDEO_ROOT. Results stream back as Server-Sent Events,
+    one `result` (or `error`) per video in completion order, then `done`.
+    """
+    files = files or []
+    paths = paths or []
+    if not files and not paths:
+        raise HTTPException(status_code=400, detail="No files or paths given")
+    max_videos = int(os.getenv("BATCH_MAX_VIDEOS", "100"))
+    if len(files) + len(paths) > max_videos:
+        raise HTTPException(status_code=413,
+                            detail=f"Batch exceeds the maximum of {max_videos} videos")
+
+    # Validate every path before saving any upload, so a bad path wastes nothing
+    try:
+        local_paths = [resolve_local_path(path) for path in paths]
+    except LocalPathError as e:
+        raise HTTPException(status_code=400, detail=str(e))
+
+    # (name, path, content hash, whether the file is ours to delete)
+    videos = []
+    try:
+        for file in files:
+            video_path, content_hash = await save_upload(file)
+            videos.append((file.filename, video_path, content_hash, True))
+    except BaseException:
+        for _, video_path, _, _ in videos:
+            os.remove(video_path)
+        raise
+    for path, local_path in zip(paths, local_paths):
+        videos.append((path, local_path, None, False))
+
+    started_at = time.time()
+    events: asyncio.Queue = asyncio.Queue()
+
+    async def analyze(index: int, name: str, video_path: str,
+                      content_hash: Optional[str], temporary: bool):
+        item = {"index": index, "name": name}
+        try:
+            if content_hash is None:
+                content_hash = await asyncio.to_thread(hash_file, video_path)
+            result = await asyncio.to_thread(get_cached_result, content_hash, cache, refresh)
+            if result is None:
+                result = await batch_analyzer.analyze(
+                    video_path, content_hash if cache else None, refresh)
+                await asyncio.to_thread(store_result, content_hash, result, cache)
+            events.put_nowait(("result", dict(item, result=result)))
+            return True
+        except QueueFullError as e:
+            events.put_nowait(("error", dict(item, status=503, detail=str(e))))
+        except Exception as e:
+            events.put_nowait(("error", dict(item, status=500, detail=str(e))))
+        finally:
+            if temporary:
+                os.remove(video_path)
+        return False
+
+    async def run_batch():
+        outcomes = await asyncio.gather(
+            *(analyze(index, *video) for index, video in enumerate(videos)))
+        elapsed = time.time() - started_at
+        events.put_nowait(("done", {
+            "videos": len(videos),
+            "succeeded": sum(outcomes),
+            "failed": len(videos) - sum(outcomes),
+            "elapsedSeconds": elapsed,
+            "videosPerHour": len(videos) * 3600 / elapsed if elapsed > 0 else None,
+        }))
+        events.put_nowait((None, None))
+
+    # the batch keeps running (and fills the cache) if the client disconnects
+    task = asyncio.create_task(run_batch())
+    background_jobs.add(task)
+    task.add_done_callback(background_jobs.discard)
+
+    async def stream():
+        yield sse_event("accepted", [{"index": index, "name": video[0]}
+                                     for index, video in enumerate(videos)])
+        while True:
+            event, data = await events.get()
+            if event is None:
+                break
+            yield sse_event(event, data)
+
+    return StreamingResponse(stream(), media_type="text/event-stream",
+                             headers={"Cache-Control": "no-cache", "X-Accel-Buffering": "no"})
+
+
+@router.post("/videos/{video_id}/chapters")
+async def rechapter(video_id: str):
+    # video_id is the content hash returned as videoId; only the LLM and alignment stages rerun
+    try:
+        result = await worker_pool.run(rechapter_video, video_id)
+    except QueueFullError as e:
+        raise HTTPException(status_code=503, detail=str(e),
+                            headers={"Retry-After": "30"})
+    if result is None:
+        raise HTTPException(status_code=404, detail="No cached transcription for this video")
+    await asyncio.to_thread(store_result, video_id, result, True)
+    return JSONResponse(content=result)
+
+
+@router.get("/cache")
+async def cache_stats():
+    if result_cache is None:
+        return {"enabled": False}
+    return dict(result_cache.stats(), enabled=True)
+
 
-    # Analyze the video
-    chapters = analyze_video(video_path)
+@router.delete("/cache/{content_hash}")
+async def invalidate_cache(content_hash: str):
+    # content_hash is the SHA-256 of the uploaded file
+    removed = result_cache.invalidate(content_hash) if result_cache else 0
+    return {"contentHash": content_hash, "removed": removed}
 
-    # remove the temporary file after processing
-    os.remove(video_path)
 
-    return JSONResponse(content=chapters)
+@router.get("/workers")
+async def worker_stats():
+    # queue depth, wait time and utilisation for sizing the pool
+    return JSONResponse(content={**worker_pool.stats(), "llm": get_llm_client().stats(),
+                                 "parsing": parse_stats.stats(), "batch": batch_analyzer.stats(),
+                                 "vad": vad_stats.stats(), "engines": engine_stats()})
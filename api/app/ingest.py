@@ -0,0 +1,220 @@
+from dotenv import load_dotenv
+
+# load .env file before the app modules read their configuration
+load_dotenv()
+
+import argparse
+import json
+import os
+import time
+from concurrent.futures import ThreadPoolExecutor
+from typing import Dict, Iterable, List, Optional, Tuple
+
+from media_analyzer.media_analyzer import analyze_video
+from utils.upload import hash_file
+
+VIDEO_EXTENSIONS = (".mp4", ".mkv", ".mov", ".webm", ".avi", ".m4v", ".mp3", ".wav", ".m4a")
+OUTPUT_SUFFIX = ".chapters.json"
+
+
+def write_json_atomic(path: str, data) -> None:
+    # a crash mid-write must not leave a truncated file that looks processed
+    tmp_path = f"{path}.tmp"
+    with open(tmp_path, "w") as file:
+        json.dump(data, file, indent=4)
+    os.replace(tmp_path, path)
+
+
+def read_manifest(path: str) -> List[str]:
+    """
+    Video paths from a manifest, one per line; blank lines and `#` comments are ignored.
+    Relative paths are resolved against the manifest's directory.
+    """
+    base = os.path.dirname(os.path.abspath(path))
+    videos = []
+    with open(path) as manifest:
+        for line in manifest:
+            line = line.strip()
+            if line and not line.startswith("#"):
+                videos.append(os.path.join(base, line))
+    return videos
+
+
+class FolderIngester:
+    """
+    Analyze video files already on disk and write the result JSON next to each
+    file, or to `results_dir` under the file's content hash.
+
+    Restartable: a file whose output already exists for the same content hash
+    is skipped, so an interrupted run picks up where it stopped.
+    """
+
+    def __init__(self, results_dir: Optional[str] = None,
+                 workers: Optional[int] = None,
+                 extensions: Iterable[str] = VIDEO_EXTENSIONS,
+                 settle_seconds: float = 30.0,
+                 use_cache: bool = True):
+        self.results_dir = results_dir
+        self.workers = workers or int(
+            os.getenv("ANALYZER_WORKERS", str(max(1, (os.cpu_count() or 2) // 2))))
+        self.extensions = tuple(extension.lower() for extension in extensions)
+        self.settle_seconds = settle_seconds
+        self.use_cache = use_cache
+        # (path, size, mtime) -> content hash, so unchanged files are hashed once
+        self._hashes: Dict[Tuple[str, int, float], str] = {}
+        # file states already handled in this run; failures are retried once the file changes
+        self._processed: set = set()
+        self._failed: set = set()
+        if results_dir:
+            os.makedirs(results_dir, exist_ok=True)
+
+    def _file_key(self, path: str) -> Tuple[str, int, float]:
+        stat = os.stat(path)
+        return path, stat.st_size, stat.st_mtime
+
+    def content_hash(self, path: str) -> str:
+        key = self._file_key(path)
+        if key not in self._hashes:
+            self._hashes[key] = hash_file(path)
+        return self._hashes[key]
+
+    def output_path(self, path: str, content_hash: str) -> str:
+        if self.results_dir:
+            return os.path.join(self.results_dir, content_hash + ".json")
+        return path + OUTPUT_SUFFIX
+
+    def is_processed(self, path: str, content_hash: str) -> bool:
+        output = self.output_path(path, content_hash)
+        if not os.path.exists(output):
+            return False
+        if self.results_dir:
+            # results are named by content hash, so existence is enough
+            return True
+        try:
+            with open(output) as file:
+                return json.load(file).get("videoId") == content_hash
+        except (OSError, ValueError):
+            return False
+
+    def process(self, path: str) -> str:
+        """
+        Analyze one file. Returns "done", "skipped" or "failed".
+        """
+        try:
+            if self._file_key(path) in self._processed:
+                return "skipped"
+            content_hash = self.content_hash(path)
+            if self.is_processed(path, content_hash):
+                self._processed.add(self._file_key(path))
+                return "skipped"
+            print(f"Analyzing {path}...")
+            result = analyze_video(path, content_hash=content_hash if self.use_cache else None)
+            if result.get("chapters") is None:
+                raise RuntimeError("chaptering failed")
+            # the video id is what restarts compare against
+            result["videoId"] = content_hash
+            output = self.output_path(path, content_hash)
+            write_json_atomic(output, result)
+            self._processed.add(self._file_key(path))
+            print(f"Wrote {output}")
+            return "done"
+        except Exception as e:
+            print(f"Error: {path}: {e}")
+            try:
+                self._failed.add(self._file_key(path))
+            except OSError:
+                pass
+            return "failed"
+
+    def run(self, paths: List[str]) -> Dict[str, int]:
+        """
+        Analyze the files with at most `workers` in flight. Returns counts per outcome.
+        """
+        counts = {"done": 0, "skipped": 0, "failed": 0}
+        with ThreadPoolExecutor(max_workers=max(1, self.workers),
+                                thread_name_prefix="ingest") as executor:
+            for outcome in executor.map(self.process, paths):
+                counts[outcome] += 1
+        return counts
+
+    def scan(self, root: str, recursive: bool = True,
+             settle_seconds: Optional[float] = None) -> List[str]:
+        """
+        Video files under `root` that are ready to analyze: not output files,
+        not failed before in their current state, and not modified within
+        `settle_seconds` (they may still be copying in).
+        """
+        settle_seconds = self.settle_seconds if settle_seconds is None else settle_seconds
+        now = time.time()
+        found = []
+        for directory, dirs, files in os.walk(root):
+            if not recursive:
+                dirs.clear()
+            for name in sorted(files):
+                path = os.path.join(directory, name)
+                if not name.lower().endswith(self.extensions):
+                    continue
+                try:
+                    key = self._file_key(path)
+                except OSError:
+                    continue
+                if key in self._processed or key in self._failed:
+                    continue
+                if now - key[2] < settle_seconds:
+                    continue
+                found.append(path)
+        return found
+
+    def watch(self, root: str, interval: float = 10.0, recursive: bool = True) -> None:
+        """
+        Poll `root` and analyze new or changed files until interrupted.
+        """
+        print(f"Watching {root} every {interval}s")
+        while True:
+            counts = self.run(self.scan(root, recursive))
+            if counts["done"] or counts["failed"]:
+                print(f"Processed {counts}")
+            time.sleep(interval)
+
+
+def main(argv: Optional[List[str]] = None) -> int:
+    parser = argparse.ArgumentParser(
+        description="Chapter video files on disk, once or as a watch-folder daemon.")
+    parser.add_argument("paths", nargs="*", help="video files or directories to analyze")
+    parser.add_argument("--manifest", help="file listing one video path per line")
+    parser.add_argument("--watch", metavar="DIR", help="keep polling this directory for new videos")
+    parser.add_argument("--interval", type=float, default=10.0, help="seconds between watch scans")
+    parser.add_argument("--results-dir", help="write <content hash>.json here instead of next to each video")
+    parser.add_argument("--workers", type=int, help="videos analyzed in parallel (default ANALYZER_WORKERS)")
+    parser.add_argument("--settle", type=float, default=30.0,
+                        help="skip watched files modified within this many seconds")
+    parser.add_argument("--no-recursive", action="store_true", help="do not descend into subdirectories")
+    parser.add_argument("--no-cache", action="store_true", help="bypass the result cache")
+    args = parser.parse_args(argv)
+
+    if not (args.paths or args.manifest or args.watch):
+        parser.error("give video paths, --manifest or --watch")
+
+    ingester = FolderIngester(args.results_dir, args.workers,
+                              settle_seconds=args.settle, use_cache=not args.no_cache)
+    videos = read_manifest(args.manifest) if args.manifest else []
+    for path in args.paths:
+        if os.path.isdir(path):
+            # files named explicitly on the command line are not settle-checked
+            videos.extend(ingester.scan(path, not args.no_recursive, settle_seconds=0))
+        else:
+            videos.append(path)
+
+    counts = ingester.run(videos) if videos else {"done": 0, "skipped": 0, "failed": 0}
+    if videos:
+        print(f"Processed {counts}")
+    if args.watch:
+        try:
+            ingester.watch(args.watch, args.interval, not args.no_recursive)
+        except KeyboardInterrupt:
+            pass
+    return 1 if counts["failed"] else 0
+
+
+if __name__ == "__main__":
+    raise SystemExit(main())
@@ -1,16 +1,41 @@
+from dotenv import load_dotenv
+
+# load .env file before the app modules read their configuration
+load_dotenv()
+
 from fastapi import FastAPI
+from fastapi.responses import PlainTextResponse
 from fastapi.middleware.cors import CORSMiddleware
 from chaptering.route import router as chapter_route
+from utils.engines import warm_up_engines, clear_engines
+from utils.worker_pool import worker_pool
+from utils.long_form import long_form_transcriber
+from media_analyzer.batch import batch_analyzer
+from utils.llm_client import get_llm_client, close_llm_clients
+from utils.metrics import stage_metrics
 from moviepy import *
-from dotenv import load_dotenv
+from contextlib import asynccontextmanager
+import os
 import uvicorn
 
 
-# load .env file
-load_dotenv()
+@asynccontextmanager
+async def lifespan(app: FastAPI):
+    # load the Whisper weights once, before the first request arrives
+    if os.getenv("WHISPER_WARMUP", "true").lower() == "true":
+        warm_up_engines()
+    # configure the chaptering backend once and share its connections
+    get_llm_client()
+    yield
+    worker_pool.shutdown(wait=False)
+    batch_analyzer.shutdown()
+    long_form_transcriber.shutdown()
+    clear_engines()
+    close_llm_clients()
+
 
 # initiate api
-app = FastAPI()
+app = FastAPI(lifespan=lifespan)
 
 # Enable CORS
 app.add_middleware(
@@ -29,5 +54,11 @@ def home():
     return {"message": "Welcome to Chaptering engine"}
 
 
+# Prometheus scrape endpoint
+@app.get("/metrics", response_class=PlainTextResponse)
+def metrics():
+    return stage_metrics.render()
+
+
 if __name__ == "__main__":
     uvicorn.run(app, host="0.0.0.0", port=8000)
\ No newline at end of file
@@ -0,0 +1,167 @@
+from typing import Any, Dict, List, Optional, Set, Tuple
+
+import numpy as np
+
+# bump when the alignment output changes so cached aligned chapters are recomputed
+ALIGNMENT_VERSION = "1"
+
+
+def get_words(text: str) -> Set[str]:
+    """Convert text to a set of cleaned words."""
+    # Clean text by removing punctuation and converting to lowercase
+    cleaned = ''.join(c.lower() for c in text if c.isalnum() or c.isspace())
+    return set(cleaned.split())
+
+
+class AlignmentIndex:
+    """
+    Whisper segments tokenized once into integer word ids.
+
+    Every segment is reduced to the array of distinct word ids it contains, so
+    chapters can be matched with a sliding window over integer counts instead of
+    re-tokenizing and intersecting word sets for every candidate span.
+    """
+
+    def __init__(self, segments: List[Dict[str, Any]]):
+        self.segments = segments
+        self.vocab: Dict[str, int] = {}
+        self.segment_words: List[np.ndarray] = []
+        for segment in segments:
+            ids = [self.vocab.setdefault(word, len(self.vocab)) for word in get_words(segment['text'])]
+            self.segment_words.append(np.array(ids, dtype=np.int64))
+
+    def chapter_mask(self, chapter_words: Set[str]) -> np.ndarray:
+        """
+        Boolean mask over the vocabulary marking the chapter's words.
+        """
+        mask = np.zeros(len(self.vocab), dtype=bool)
+        ids = [self.vocab[word] for word in chapter_words if word in self.vocab]
+        mask[ids] = True
+        return mask
+
+    def find_span(self, chapter_content: str, offset: int = 0,
+                  required_coverage: float = 0.85) -> Tuple[Optional[int], Optional[int]]:
+        """
+        Find the shortest run of consecutive segments at or after `offset` that
+        covers `required_coverage` of the chapter's distinct words.
+
+        Same semantics as the original exhaustive search: a start is abandoned once
+        its window holds more than twice as many distinct words as the chapter, and
+        ties go to the earliest start. Both the coverage and the distinct-word count
+        only grow with the window end and only shrink with its start, so a single
+        two-pointer sweep visits each segment at most twice.
+
+        Returns absolute (start_index, end_index) or (None, None).
+        """
+        chapter_words = get_words(chapter_content)
+        total_chapter_words = len(chapter_words)
+        if total_chapter_words == 0:
+            return None, None
+
+        in_chapter = self.chapter_mask(chapter_words)
+        counts = np.zeros(len(self.vocab), dtype=np.int64)
+        max_words = total_chapter_words * 2
+        n_segments = len(self.segments)
+
+        covered = 0
+        distinct = 0
+        best_start = None
+        best_end = None
+        min_segments_needed = float('inf')
+
+        # window is segments[start:end + 1]; end == start - 1 means empty
+        end = offset - 1
+        for start in range(offset, n_segments):
+            while True:
+                if end >= start:
+                    # Calculate word coverage
+                    coverage = covered / total_chapter_words
+                    if coverage >= required_coverage:
+                        segments_needed = end - start + 1
+                        if segments_needed < min_segments_needed:
+                            min_segments_needed = segments_needed
+                            best_start = start
+                            best_end = end
+                        break
+                    # If we've accumulated too many extra words, break this attempt
+                    if distinct > max_words:
+                        break
+                if end + 1 >= n_segments:
+                    # no later start can reach coverage either
+                    return best_start, best_end
+                end += 1
+                ids = self.segment_words[end]
+                fresh = ids[counts[ids] == 0]
+                distinct += len(fresh)
+                covered += int(np.count_nonzero(in_chapter[fresh]))
+                counts[ids] += 1
+
+            # slide the start past the current segment
+            ids = self.segment_words[start]
+            counts[ids] -= 1
+            gone = ids[counts[ids] == 0]
+            distinct -= len(gone)
+            covered -= int(np.count_nonzero(in_chapter[gone]))
+
+        return best_start, best_end
+
+
+def similarity_matrix(chapter_texts: List[str], segment_texts: List[str]) -> np.ndarray:
+    """
+    Dense chapter x segment TF-IDF cosine similarity matrix.
+    """
+    from sklearn.feature_extraction.text import TfidfVectorizer
+
+    vectorizer = TfidfVectorizer(sublinear_tf=True)
+    # fit on both sides so chapter-only words still get a vocabulary slot
+    vectorizer.fit(segment_texts + chapter_texts)
+    chapters = vectorizer.transform(chapter_texts)
+    segments = vectorizer.transform(segment_texts)
+    # rows are L2-normalized, so the dot product is the cosine similarity
+    return (chapters @ segments.T).toarray()
+
+
+def monotonic_alignment(scores: np.ndarray) -> List[Tuple[int, int]]:
+    """
+    Split segments 0..N-1 into K contiguous, non-empty, in-order spans (one per
+    chapter) maximizing the total chapter/segment similarity.
+
+    dp[k, j] is the best score with segment j as the last one of chapter k:
+        dp[k, j] = prefix[k, j] + max over i <= j of (dp[k-1, i-1] - prefix[k, i-1])
+    where prefix is the running sum of row k, so each row is computed with one
+    cumulative maximum. Total cost O(K x N), with no rescans.
+
+    Returns [(start, end), ...] per chapter, inclusive.
+    """
+    n_chapters, n_segments = scores.shape
+    if n_chapters == 0:
+        return []
+    if n_segments < n_chapters:
+        raise ValueError("Need at least one segment per chapter")
+
+    positions = np.arange(n_segments)
+    starts = np.zeros((n_chapters, n_segments), dtype=np.int64)
+    prefix = np.cumsum(scores, axis=1)
+    # prefix shifted by one: sum of row k over segments < i
+    before = np.concatenate([np.zeros((n_chapters, 1)), prefix[:, :-1]], axis=1)
+
+    # the first chapter always starts at segment 0
+    dp = prefix[0].copy()
+    for k in range(1, n_chapters):
+        previous = np.full(n_segments, -np.inf)
+        # chapter k may start at i only if chapter k-1 ended at i-1
+        previous[1:] = dp[:-1]
+        candidates = previous - before[k]
+        best = np.maximum.accumulate(candidates)
+        # latest start achieving the running maximum
+        starts[k] = np.maximum.accumulate(np.where(candidates == best, positions, 0))
+        dp = prefix[k] + best
+
+    spans = []
+    end = n_segments - 1
+    for k in range(n_chapters - 1, -1, -1):
+        start = int(starts[k, end]) if k > 0 else 0
+        spans.append((start, end))
+        end = start - 1
+    spans.reverse()
+    return spans
@@ -0,0 +1,87 @@
+import asyncio
+import functools
+import os
+import time
+from concurrent.futures import ThreadPoolExecutor
+from typing import Any, Dict, Optional
+
+from media_analyzer.media_analyzer import transcribe_video, chapter_video
+from utils.worker_pool import WorkerPool, worker_pool
+
+
+class BatchAnalyzer:
+    """
+    Pipeline for analyzing many videos at once.
+
+    Whisper runs on the shared worker pool, one video per worker, so each worker
+    keeps a single resident model (shared by the threads of a thread pool, one
+    per process for a process pool). Chaptering is mostly waiting on the LLM, so
+    it runs on its own threads: a video's LLM calls overlap with the next video's
+    transcription instead of holding a Whisper worker.
+    """
+
+    def __init__(self, pool: WorkerPool = worker_pool,
+                 chapter_workers: Optional[int] = None):
+        self.pool = pool
+        self.chapter_workers = chapter_workers or int(
+            os.getenv("BATCH_CHAPTER_WORKERS", os.getenv("LLM_CONCURRENCY", "4")))
+        self._executor: Optional[ThreadPoolExecutor] = None
+        self._transcribing: Optional[asyncio.Semaphore] = None
+        self._active = 0
+        self._completed = 0
+        self._failed = 0
+        self._busy_seconds = 0.0
+
+    def _get_executor(self) -> ThreadPoolExecutor:
+        if self._executor is None:
+            self._executor = ThreadPoolExecutor(
+                max_workers=max(1, self.chapter_workers), thread_name_prefix="chaptering")
+        return self._executor
+
+    def _get_semaphore(self) -> asyncio.Semaphore:
+        # batches never queue more Whisper work than there are workers, so they
+        # do not crowd single-video requests out of the pool's queue
+        if self._transcribing is None:
+            self._transcribing = asyncio.Semaphore(self.pool.max_workers)
+        return self._transcribing
+
+    async def analyze(self, video_path: str, content_hash: Optional[str] = None,
+                      refresh: bool = False) -> Dict[str, Any]:
+        """
+        Transcribe on the worker pool, then chapter on the chaptering threads.
+        """
+        started_at = time.time()
+        self._active += 1
+        try:
+            async with self._get_semaphore():
+                segments = await self.pool.run(
+                    transcribe_video, video_path, content_hash=content_hash, refresh=refresh)
+            loop = asyncio.get_running_loop()
+            result = await loop.run_in_executor(
+                self._get_executor(),
+                functools.partial(chapter_video, segments, content_hash, refresh))
+        except Exception:
+            self._failed += 1
+            raise
+        finally:
+            self._active -= 1
+            self._busy_seconds += time.time() - started_at
+        self._completed += 1
+        return result
+
+    def stats(self) -> Dict[str, Any]:
+        return {
+            "chapterWorkers": self.chapter_workers,
+            "activeVideos": self._active,
+            "completed": self._completed,
+            "failed": self._failed,
+            "avgSecondsPerVideo": self._busy_seconds / self._completed if self._completed else 0.0,
+        }
+
+    def shutdown(self) -> None:
+        if self._executor is not None:
+            self._executor.shutdown(wait=False, cancel_futures=True)
+            self._executor = None
+
+
+batch_analyzer = BatchAnalyzer()
@@ -1,37 +1,211 @@
 import datetime
-import requests
 import os
 import json
-from typing import List, Dict, Any, Set
+from typing import List, Dict, Any, Optional, Callable, Tuple
 from utils.video_processor import VideoProcessor
+from utils.llm_client import LLMError, get_llm_client
+from utils.json_stream import ChapterStreamParser
+from utils.chapter_parser import parse_chapter_response
+from utils.result_cache import result_cache, make_cache_key
+from utils.metrics import RequestTrace, span, tracing
+from media_analyzer.alignment import (ALIGNMENT_VERSION, AlignmentIndex, similarity_matrix,
+                                     monotonic_alignment)
 
-ollama_url = os.getenv("OLLAMA_API")
-ollama_model = os.getenv("OLLAMA_MODEL")
-headers = {"Content-Type": "application/json"}
 
-# using the VideoProcessor class and whisper API and gemini API (flash model) to process the video and generate chapters
-def analyze_video(video):
+def stage_key(content_hash: str, stage: str, *fingerprints: str) -> str:
     """
-    Process a video file and return the transcript and chapters.
+    Cache key for one pipeline stage of a video.
     """
-    processor = VideoProcessor()
+    return make_cache_key(content_hash, ":".join((stage,) + fingerprints))
+
+
+def run_stage(key: Optional[str], content_hash: Optional[str], compute: Callable, refresh: bool = False,
+              stage: Optional[str] = None):
+    """
+    Return the cached output of a stage, or compute and persist it.
+    `stage` names the lookup in the cache's per-stage hit counters.
+    """
+    if result_cache is None or key is None:
+        return compute()
+    if not refresh:
+        cached = result_cache.get(key, stage=stage)
+        if cached is not None:
+            return cached
+    value = compute()
+    if value is not None:
+        result_cache.set(key, content_hash, value)
+    return value
+
+
+def transcribe_stage(processor: VideoProcessor, video, content_hash: Optional[str] = None,
+                     refresh: bool = False,
+                     progress: Optional[Callable[[str, float], None]] = None,
+                     on_event: Optional[Callable[[str, Any], None]] = None):
+    """
+    Whisper segments for the video, cached per content hash and Whisper configuration.
+    With `on_event`, segments are emitted as "segments" events while they are decoded.
+    """
+    key = None
+    if content_hash:
+        key = stage_key(content_hash, "segments", processor.transcription_fingerprint())
+
+    streamed = []
+    on_segments = None
+    if on_event:
+        def on_segments(window_segments):
+            streamed.extend(window_segments)
+            on_event("segments", window_segments)
+
+    with span("transcription"):
+        segments = run_stage(key, content_hash,
+                             lambda: processor.transcribe_video(video, progress, on_segments), refresh,
+                             stage="segments")
+    if on_event and not streamed:
+        # served from the cache, so nothing was streamed while decoding
+        on_event("segments", segments)
+    return segments
+
+
+def cached_segments(processor: VideoProcessor, content_hash: str) -> Optional[List[Dict[str, Any]]]:
+    """
+    Previously transcribed segments for a video id, or None if it was never transcribed.
+    """
+    if result_cache is None:
+        return None
+    return result_cache.get(
+        stage_key(content_hash, "segments", processor.transcription_fingerprint()), stage="segments")
 
-    # Transcribe video
-    print("Transcribing video...")
-    segments = processor.transcribe_video(video)
+
+def chapter_stage(processor: VideoProcessor, segments: List[Dict[str, Any]],
+                  content_hash: Optional[str] = None,
+                  progress: Optional[Callable[[str, float], None]] = None,
+                  refresh: bool = False,
+                  on_event: Optional[Callable[[str, Any], None]] = None) -> Dict[str, Any]:
+    """
+    Build the transcript, chapters and aligned chapters from Whisper segments.
+    Each stage is cached separately so a prompt change only reruns the LLM call.
+    `on_event` receives each stage's output as soon as it is available.
+    """
+    report = progress or (lambda stage, fraction: None)
+    emit = on_event or (lambda event, data: None)
+    whisper_fp = processor.transcription_fingerprint()
+    llm_fp = processor.chaptering_fingerprint()
+
+    def key(stage, *fingerprints):
+        return stage_key(content_hash, stage, *fingerprints) if content_hash else None
 
     # Create timestamped transcript
     print("Creating transcript...")
-    transcript = processor.create_timestamped_transcript(segments)
+    with span("transcript"):
+        transcript = run_stage(key("transcript", whisper_fp), content_hash,
+                               lambda: processor.create_timestamped_transcript(segments),
+                               stage="transcript")
+    emit("transcript", transcript)
 
     # Analyze content and create chapters
     print("Analyzing content and creating chapters...")
-    chapters = processor.analyze_content(transcript)
-
-    return {
+    report("chaptering", 0.7)
+    if os.getenv("CHAPTER_OUTPUT", "content") == "segments":
+        # the LLM returns start segment ids only; content is rebuilt from the segments
+        compute_chapters = lambda: processor.chapter_segments(segments)
+    else:
+        compute_chapters = lambda: processor.chapter_transcript(transcript, on_chapter)
+    mode = os.getenv("ALIGNMENT_MODE", "greedy")
+    # greedy alignment is sequential, so each chapter can be placed as soon as
+    # the LLM finishes generating it
+    streamed = StreamingAligner(segments)
+
+    def on_chapter(chapter):
+        aligned = streamed.add(chapter) if mode == "greedy" else None
+        emit("chapter", {"chapter": chapter, "aligned": aligned})
+
+    with span("chaptering"):
+        chapters = run_stage(key("chapters", whisper_fp, llm_fp), content_hash,
+                             compute_chapters, refresh, stage="chapters")
+    emit("chapters", chapters)
+
+    # Attach Whisper timestamps to the LLM chapters
+    print("Aligning chapters...")
+    report("aligning", 0.9)
+    aligned_chapters = []
+    if chapters and chapters.get("chapters"):
+        def compute_aligned():
+            if mode == "greedy" and streamed.matches(chapters["chapters"]):
+                return streamed.aligned
+            return align_chapters(chapters["chapters"], segments, mode)
+
+        with span("alignment"):
+            aligned_chapters = run_stage(
+                key("aligned", whisper_fp, llm_fp, ALIGNMENT_VERSION, mode), content_hash,
+                compute_aligned, refresh, stage="aligned")
+    emit("alignedChapters", aligned_chapters)
+    report("aligning", 1.0)
+
+    result = {
         "transcript": transcript,
-        "chapters": chapters
+        "chapters": chapters,
+        "alignedChapters": aligned_chapters
     }
+    if content_hash:
+        result["videoId"] = content_hash
+    return result
+
+
+# using the VideoProcessor class and whisper API and gemini API (flash model) to process the video and generate chapters
+def analyze_video(video, progress: Optional[Callable[[str, float], None]] = None,
+                  content_hash: Optional[str] = None, refresh: bool = False,
+                  on_event: Optional[Callable[[str, Any], None]] = None,
+                  timings: bool = False):
+    """
+    Process a video file and return the transcript and chapters.
+
+    `progress` is called with (stage, fraction) as the pipeline advances.
+    When `content_hash` is given, every stage is cached under that video id;
+    `refresh` recomputes and overwrites the cached stages.
+    `on_event` is called with (event, data) for segments, transcript, chapters
+    and alignedChapters as each becomes available.
+    With `timings`, the result carries a `timings` block with every stage's span.
+    """
+    report = progress or (lambda stage, fraction: None)
+    processor = VideoProcessor(streaming=on_event is not None)
+    trace = RequestTrace() if timings else None
+
+    with tracing(trace), span("analysis"):
+        # Transcribe video
+        print("Transcribing video...")
+        segments = transcribe_stage(processor, video, content_hash, refresh, report, on_event)
+
+        result = chapter_stage(processor, segments, content_hash, report, refresh, on_event)
+    if trace is not None:
+        result["timings"] = trace.to_dict()
+    return result
+
+
+def transcribe_video(video, content_hash: Optional[str] = None, refresh: bool = False):
+    """
+    Run only the Whisper stage of `analyze_video` and return the segments.
+    """
+    print("Transcribing video...")
+    return transcribe_stage(VideoProcessor(), video, content_hash, refresh)
+
+
+def chapter_video(segments: List[Dict[str, Any]], content_hash: Optional[str] = None,
+                  refresh: bool = False) -> Dict[str, Any]:
+    """
+    Run the chaptering and alignment stages of `analyze_video` on Whisper segments.
+    """
+    return chapter_stage(VideoProcessor(), segments, content_hash, refresh=refresh)
+
+
+def rechapter_video(content_hash: str, progress: Optional[Callable[[str, float], None]] = None):
+    """
+    Re-run chaptering for an already transcribed video. Returns None if no segments are cached.
+    """
+    processor = VideoProcessor()
+    segments = cached_segments(processor, content_hash)
+    if segments is None:
+        return None
+    return chapter_stage(processor, segments, content_hash, progress, refresh=True)
 
 
 
@@ -56,26 +230,26 @@ def generate_chapters(transcription):
     return aligned_chapters if aligned_chapters else []
 
 
-def chapter_breakdown(transcription_txt):
+def chapter_breakdown(transcription_txt, on_chapter=None):
     """Break down the transcription text using gemma2:2b model"""
-    print(ollama_url)
-    ollama_rq = {
-        "model": ollama_model,
-        "prompt": json.dumps(create_ollama_prompt(transcription_txt)),
-        "stream": False,
-        "format": "json"
-    }
-    generate_url = ollama_url + "/api/generate"
+    client = get_llm_client("ollama")
+    print(client.url)
+    parser = ChapterStreamParser()
     try:
-        response = requests.post(generate_url, json=ollama_rq, headers=headers)
-        response.raise_for_status()
-        result = response.json()
-
-        # Parse the JSON string
-        data = json.loads(result["response"])
-        return data
-    except requests.exceptions.RequestException as e:
+        # consume tokens as they are generated; chapters are emitted once complete
+        for chunk in client.stream(json.dumps(create_ollama_prompt(transcription_txt))):
+            for chapter in parser.feed(chunk):
+                if on_chapter:
+                    on_chapter(chapter)
+    except LLMError as e:
         print(f"Error: {e}")
+        return parser.partial_result() if parser.chapters else None
+
+    # Parse and validate, keeping the complete chapters of a malformed response
+    data, outcome, error = parse_chapter_response(parser.text)
+    if data is None:
+        print(f"Error: Could not parse the content as JSON ({error}).")
+    return data
 
 
 def create_ollama_prompt(transcription_text):
@@ -115,16 +289,11 @@ def format_timestamp(seconds):
     """Convert seconds to HH:MM:SS format"""
     return str(datetime.timedelta(seconds=int(seconds)))
 
-def get_words(text: str) -> Set[str]:
-    """Convert text to a set of cleaned words."""
-    # Clean text by removing punctuation and converting to lowercase
-    cleaned = ''.join(c.lower() for c in text if c.isalnum() or c.isspace())
-    return set(cleaned.split())
-
-
 def find_chapter_segments(chapter_content: str,
                           segments: List[Dict[str, Any]],
-                          required_coverage: float = 0.85) -> tuple:
+                          required_coverage: float = 0.85,
+                          index: Optional[AlignmentIndex] = None,
+                          offset: int = 0) -> tuple:
     """
     Find the minimal set of consecutive segments that cover the chapter content.
 
@@ -132,45 +301,51 @@ def find_chapter_segments(chapter_content: str,
         chapter_content: The text content of the chapter
         segments: List of transcript segments
         required_coverage: Minimum percentage of chapter words that must be found
+        index: Prebuilt AlignmentIndex over `segments`, to avoid re-tokenizing them
+        offset: Only consider segments from this index on
 
     Returns:
         tuple: (start_index, end_index) or (None, None) if no match found
     """
-    chapter_words = get_words(chapter_content)
-    total_chapter_words = len(chapter_words)
-
-    best_start = None
-    best_end = None
-    min_segments_needed = float('inf')
-
-    # Try each segment as a potential starting point
-    for start_idx in range(len(segments)):
-        current_words = set()
-
-        # Accumulate segments until we have sufficient coverage
-        for end_idx in range(start_idx, len(segments)):
-            segment_text = segments[end_idx]['text']
-            current_words.update(get_words(segment_text))
-
-            # Calculate word coverage
-            common_words = chapter_words.intersection(current_words)
-            coverage = len(common_words) / total_chapter_words
+    if index is None:
+        index = AlignmentIndex(segments)
+    return index.find_span(chapter_content, offset, required_coverage)
 
-            # Check if we have sufficient coverage
-            if coverage >= required_coverage:
-                segments_needed = end_idx - start_idx + 1
-                # Update if we found a shorter sequence that meets our coverage
-                if segments_needed < min_segments_needed:
-                    min_segments_needed = segments_needed
-                    best_start = start_idx
-                    best_end = end_idx
-                break
 
-            # If we've accumulated too many extra words, break this attempt
-            if len(current_words) > total_chapter_words * 2:
-                break
-
-    return best_start, best_end
+def align_chapter(chapter: Dict[str, Any], segments: List[Dict[str, Any]],
+                  index: AlignmentIndex, offset: int = 0) -> Tuple[Dict[str, Any], int]:
+    """
+    Align one chapter with the segments at or after `offset`.
+    Returns the aligned chapter and the offset for the next chapter.
+    """
+    # Find matching segments for this chapter
+    start_idx, end_idx = find_chapter_segments(
+        chapter["content"],
+        segments,
+        index=index,
+        offset=offset
+    )
+
+    if start_idx is not None and end_idx is not None:
+        # Create aligned chapter; the next chapter starts after this one
+        return {
+            "chapterNumber": chapter.get("chapterNumber"),
+            "title": chapter.get("title"),
+            "content": chapter["content"],
+            "start": segments[start_idx]["start"],
+            "end": segments[end_idx]["end"],
+            "segments": list(range(start_idx, end_idx + 1))
+        }, end_idx + 1
+
+    # If no matching segments found
+    return {
+        "chapterNumber": chapter.get("chapterNumber"),
+        "title": chapter.get("title"),
+        "content": chapter["content"],
+        "start": None,
+        "end": None,
+        "segments": []
+    }, offset
 
 
 def align_chapters_with_whisper(chapters: List[Dict[str, Any]],
@@ -180,47 +355,104 @@ def align_chapters_with_whisper(chapters: List[Dict[str, Any]],
     """
     aligned_chapters = []
     current_segment_idx = 0
+    # Tokenize every segment once for all chapters
+    index = AlignmentIndex(segments)
 
     for chapter in chapters:
-        # Find matching segments for this chapter
-        start_idx, end_idx = find_chapter_segments(
-            chapter["content"],
-            segments[current_segment_idx:]
-        )
-
-        if start_idx is not None and end_idx is not None:
-            # Adjust indices based on current_segment_idx
-            start_idx += current_segment_idx
-            end_idx += current_segment_idx
-
-            # Create aligned chapter
-            aligned_chapter = {
-                "chapterNumber": chapter["chapterNumber"],
-                "title": chapter["title"],
-                "content": chapter["content"],
-                "start": segments[start_idx]["start"],
-                "end": segments[end_idx]["end"],
-                "segments": list(range(start_idx, end_idx + 1))
-            }
-
-            # Update current_segment_idx for next iteration
-            current_segment_idx = end_idx + 1
-        else:
-            # If no matching segments found
-            aligned_chapter = {
-                "chapterNumber": chapter["chapterNumber"],
-                "title": chapter["title"],
-                "content": chapter["content"],
-                "start": None,
-                "end": None,
-                "segments": []
-            }
-
+        aligned_chapter, current_segment_idx = align_chapter(
+            chapter, segments, index, current_segment_idx)
         aligned_chapters.append(aligned_chapter)
 
     return aligned_chapters
 
 
+class StreamingAligner:
+    """
+    Greedy alignment fed one chapter at a time, as chapters stream in.
+    """
+
+    def __init__(self, segments: List[Dict[str, Any]]):
+        self.segments = segments
+        self.index: Optional[AlignmentIndex] = None
+        self.offset = 0
+        self.chapters: List[Dict[str, Any]] = []
+        self.aligned: List[Dict[str, Any]] = []
+
+    def add(self, chapter: Dict[str, Any]) -> Optional[Dict[str, Any]]:
+        if "content" not in chapter:
+            return None
+        if self.index is None:
+            self.index = AlignmentIndex(self.segments)
+        aligned_chapter, self.offset = align_chapter(chapter, self.segments, self.index, self.offset)
+        self.chapters.append(chapter)
+        self.aligned.append(aligned_chapter)
+        return aligned_chapter
+
+    def matches(self, chapters: List[Dict[str, Any]]) -> bool:
+        """
+        True when the streamed chapters are exactly the final ones.
+        """
+        return bool(self.chapters) and self.chapters == chapters
+
+
+def align_chapters_globally(chapters: List[Dict[str, Any]],
+                            segments: List[Dict[str, Any]]) -> List[Dict[str, Any]]:
+    """
+    Place all chapters on the segment timeline at once with a monotonic DP over a
+    TF-IDF chapter x segment similarity matrix. Every segment belongs to exactly
+    one chapter, so boundaries are contiguous and gap-free.
+    """
+    if len(segments) < len(chapters):
+        # not enough segments to give each chapter its own span
+        return align_chapters_with_whisper(chapters, segments)
+
+    scores = similarity_matrix([chapter.get("content", "") for chapter in chapters],
+                               [segment["text"] for segment in segments])
+    aligned_chapters = []
+    for chapter, (start_idx, end_idx) in zip(chapters, monotonic_alignment(scores)):
+        aligned_chapters.append({
+            "chapterNumber": chapter.get("chapterNumber"),
+            "title": chapter.get("title"),
+            "content": chapter.get("content", ""),
+            "start": segments[start_idx]["start"],
+            "end": segments[end_idx]["end"],
+            "segments": list(range(start_idx, end_idx + 1))
+        })
+    return aligned_chapters
+
+
+def align_chapters_by_segment_ids(chapters: List[Dict[str, Any]],
+                                  segments: List[Dict[str, Any]]) -> List[Dict[str, Any]]:
+    """
+    Aligned chapters for chapters built from start segment ids.
+    """
+    return [{
+        "chapterNumber": chapter["chapterNumber"],
+        "title": chapter["title"],
+        "content": chapter["content"],
+        "start": segments[chapter["startSegment"]]["start"],
+        "end": segments[chapter["endSegment"]]["end"],
+        "segments": list(range(chapter["startSegment"], chapter["endSegment"] + 1))
+    } for chapter in chapters]
+
+
+def align_chapters(chapters: List[Dict[str, Any]],
+                   segments: List[Dict[str, Any]],
+                   mode: str = "greedy") -> List[Dict[str, Any]]:
+    """
+    Align chapters with Whisper segments: "greedy" matches chapters one at a time
+    by word coverage, "global" aligns all of them in a single DP pass.
+    Chapters that already carry segment ids need no text matching at all.
+    """
+    if chapters and all("startSegment" in chapter and "endSegment" in chapter for chapter in chapters):
+        return align_chapters_by_segment_ids(chapters, segments)
+    if mode == "global":
+        return align_chapters_globally(chapters, segments)
+    if mode == "greedy":
+        return align_chapters_with_whisper(chapters, segments)
+    raise ValueError(f"Unsupported alignment mode: {mode}")
+
+
 def write_to_json(file_path, data):
     with open(file_path, "w") as file:
         json.dump(data, file, indent=4)
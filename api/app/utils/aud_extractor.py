@@ -1,32 +1,78 @@
 from moviepy import *
 import numpy as np
+from typing import Optional
 
 class AudioExtractor:
-    def __init__(self, vid_filename: str, aud_out_filename: str):
+    def __init__(self, vid_filename: str, aud_out_filename: Optional[str] = None,
+                 sampling_rate: int = 16000):
         self.vid_filename = vid_filename
         self.aud_out_filename = aud_out_filename
+        # ffmpeg resamples to this rate while decoding
+        self.sampling_rate = sampling_rate
         self.audio = None
+        self.audio_array = None
+
+    def __enter__(self) -> "AudioExtractor":
+        self.extract_audio()
+        return self
+
+    def __exit__(self, *exc) -> None:
+        self.close()
 
     def extract_audio(self) -> AudioFileClip:
+        """Open the audio track. The clip stays open until `close()` is called."""
         try:
-            self.audio = AudioFileClip(self.vid_filename)
+            self.audio = AudioFileClip(self.vid_filename, fps=self.sampling_rate)
             print("Audio extraction successful!")
             return self.audio
         except Exception as e:
+            self.close()
             raise RuntimeError(f"Error extracting audio: {e}")
-        finally:
-            if self.audio:
-                self.audio.close()
 
-    def to_soundarray(self, sampling_rate: int) -> np.ndarray:
+    def to_soundarray(self, sampling_rate: Optional[int] = None,
+                      chunk_duration: float = 30.0) -> np.ndarray:
+        """
+        Decode the audio track to a mono float32 array.
+
+        The track is read block by block and each block is downmixed as it
+        arrives, so the full multi-channel signal is never held in memory.
+        """
         if self.audio is None:
             raise ValueError("Audio has not been extracted.")
-        audio_array = self.audio.to_soundarray(fps=sampling_rate)
-        self.audio_array = np.mean(audio_array, axis=1)
+        if sampling_rate and sampling_rate != self.sampling_rate:
+            # the decoder resamples, so reopen the track at the requested rate
+            self.close()
+            self.sampling_rate = sampling_rate
+            self.extract_audio()
+
+        reader = self.audio.reader
+        reader.initialize()
+        total = int(self.sampling_rate * self.audio.duration)
+        chunksize = max(1, int(chunk_duration * self.sampling_rate))
+        audio_array = np.empty(total, dtype=np.float32)
+        filled = 0
+        while filled < total:
+            size = min(chunksize, total - filled)
+            block = reader.read_chunk(size)
+            audio_array[filled:filled + size] = block.mean(axis=1, dtype=np.float32)
+            filled += size
+
+        self.audio_array = audio_array
         return self.audio_array
 
     def save_audio(self) -> None:
         if self.audio is None:
             raise ValueError("Please extract audio before saving.")
         self.audio.write_audiofile(self.aud_out_filename)
-        self.audio.close()
+        self.close()
+
+    def close(self) -> None:
+        if self.audio is not None:
+            self.audio.close()
+            self.audio = None
+
+
+def decode_audio(filename: str, sampling_rate: int = 16000) -> np.ndarray:
+    """Decode a media file once, straight to a mono float32 array at `sampling_rate`."""
+    with AudioExtractor(filename, sampling_rate=sampling_rate) as extractor:
+        return extractor.to_soundarray()
@@ -0,0 +1,268 @@
+import os
+import queue
+import threading
+import time
+from concurrent.futures import Future
+from typing import Any, Callable, Dict, List, Optional, Tuple
+
+import numpy as np
+import torch
+import whisper
+from whisper.audio import HOP_LENGTH, N_FRAMES, N_SAMPLES, SAMPLE_RATE
+from whisper.tokenizer import get_tokenizer
+
+# Whisper's own transcribe() defaults
+TEMPERATURES = (0.0, 0.2, 0.4, 0.6, 0.8, 1.0)
+COMPRESSION_RATIO_THRESHOLD = 2.4
+LOGPROB_THRESHOLD = -1.0
+NO_SPEECH_THRESHOLD = 0.6
+
+# (mel window of shape (n_mels, N_FRAMES), temperature, language) -> DecodingResult
+DecodeFn = Callable[[torch.Tensor, float, Optional[str]], whisper.DecodingResult]
+
+
+def is_silent(result: whisper.DecodingResult) -> bool:
+    return result.no_speech_prob > NO_SPEECH_THRESHOLD and result.avg_logprob < LOGPROB_THRESHOLD
+
+
+def decode_with_fallback(decode: DecodeFn, mel: torch.Tensor,
+                         language: Optional[str] = None) -> whisper.DecodingResult:
+    """
+    Decode a window greedily, retrying at higher temperatures when the output
+    looks repetitive or unlikely, as Whisper's transcribe() does.
+    """
+    for temperature in TEMPERATURES:
+        result = decode(mel, temperature, language)
+        if is_silent(result):
+            break
+        if (result.compression_ratio <= COMPRESSION_RATIO_THRESHOLD
+                and result.avg_logprob >= LOGPROB_THRESHOLD):
+            break
+    return result
+
+
+def window_segments(result: whisper.DecodingResult, tokenizer, time_offset: float,
+                    segment_frames: int, input_stride: int) -> Tuple[List[Dict[str, Any]], int]:
+    """
+    Split one decoded window into segments at its timestamp tokens.
+    Returns the segments and how many mel frames the window consumed.
+    """
+    time_precision = input_stride * HOP_LENGTH / SAMPLE_RATE
+    tokens = result.tokens
+    timestamp_begin = tokenizer.timestamp_begin
+    is_timestamp = [token >= timestamp_begin for token in tokens]
+
+    def segment(start: float, end: float, segment_tokens: List[int]) -> Dict[str, Any]:
+        return {
+            "seek": 0,
+            "start": time_offset + start,
+            "end": time_offset + end,
+            "text": tokenizer.decode(segment_tokens),
+            "tokens": segment_tokens,
+            "temperature": result.temperature,
+            "avg_logprob": result.avg_logprob,
+            "compression_ratio": result.compression_ratio,
+            "no_speech_prob": result.no_speech_prob,
+        }
+
+    # a pair of timestamps in a row closes one segment and opens the next
+    consecutive = [idx + 1 for idx in range(len(tokens) - 1)
+                   if is_timestamp[idx] and is_timestamp[idx + 1]]
+    single_timestamp_ending = is_timestamp[-2:] == [False, True]
+
+    if not consecutive:
+        duration = segment_frames * HOP_LENGTH / SAMPLE_RATE
+        timestamps = [token for token, flag in zip(tokens, is_timestamp) if flag]
+        if timestamps and timestamps[-1] != timestamp_begin:
+            duration = (timestamps[-1] - timestamp_begin) * time_precision
+        return [segment(0.0, duration, tokens)], segment_frames
+
+    slices = consecutive + ([len(tokens)] if single_timestamp_ending else [])
+    segments = []
+    last_slice = 0
+    for current_slice in slices:
+        sliced = tokens[last_slice:current_slice]
+        segments.append(segment((sliced[0] - timestamp_begin) * time_precision,
+                                (sliced[-1] - timestamp_begin) * time_precision, sliced))
+        last_slice = current_slice
+
+    if single_timestamp_ending:
+        return segments, segment_frames
+    # the text after the last complete segment is decoded again in the next window
+    consumed = (tokens[last_slice - 1] - timestamp_begin) * input_stride
+    return segments, consumed if consumed > 0 else segment_frames
+
+
+def transcribe_mel(mel: torch.Tensor, decode: DecodeFn, tokenizer,
+                   input_stride: int, language: Optional[str] = None) -> Dict[str, Any]:
+    """
+    Transcribe a log-mel spectrogram computed with `padding=N_SAMPLES` by
+    sliding 30-second windows over it. Full windows are views into `mel`.
+    """
+    content_frames = mel.shape[-1] - N_FRAMES
+    seek = 0
+    segments: List[Dict[str, Any]] = []
+    while seek < content_frames:
+        segment_frames = min(N_FRAMES, content_frames - seek)
+        window = mel[:, seek:seek + segment_frames]
+        if segment_frames < N_FRAMES:
+            # only the last window is shorter; pad it the way transcribe() does
+            window = whisper.pad_or_trim(window, N_FRAMES)
+        result = decode_with_fallback(decode, window, language)
+        if is_silent(result):
+            seek += segment_frames
+            continue
+
+        decoded, consumed = window_segments(
+            result, tokenizer, seek * HOP_LENGTH / SAMPLE_RATE, segment_frames, input_stride)
+        for segment in decoded:
+            if segment["start"] == segment["end"] or not segment["text"].strip():
+                continue
+            segment["id"] = len(segments)
+            segment["seek"] = seek
+            segments.append(segment)
+        seek += consumed
+
+    return {
+        "text": "".join(segment["text"] for segment in segments),
+        "segments": segments,
+        "language": language,
+    }
+
+
+def detect_language(model, mel: torch.Tensor, fp16: bool, lock: threading.Lock) -> str:
+    """
+    Language of the first 30-second window, used for the whole file as
+    Whisper's transcribe() does, so segments do not switch language midway.
+    `lock` guards the model against a concurrent forward pass (see DecodeBatcher).
+    """
+    if not model.is_multilingual:
+        return "en"
+    window = whisper.pad_or_trim(mel, N_FRAMES).to(model.device)
+    with lock:
+        _, probs = model.detect_language(window.half() if fp16 else window)
+    return max(probs, key=probs.get)
+
+
+def transcribe_array(model, audio: np.ndarray, batcher: "DecodeBatcher") -> Dict[str, Any]:
+    """
+    Transcribe a 16 kHz mono array of any length with its windows decoded
+    by `batcher`. The mel spectrogram is computed once for the whole buffer.
+    """
+    mel = whisper.log_mel_spectrogram(audio, model.dims.n_mels, padding=N_SAMPLES,
+                                      device=model.device)
+    language = detect_language(model, mel, batcher.fp16, batcher.model_lock)
+    tokenizer = get_tokenizer(model.is_multilingual, num_languages=model.num_languages,
+                              language=language, task="transcribe")
+    input_stride = N_FRAMES // model.dims.n_audio_ctx
+    return transcribe_mel(mel, batcher.decode, tokenizer, input_stride, language)
+
+
+class DecodeBatcher:
+    """
+    Collects 30-second mel windows from concurrent transcriptions and decodes
+    them together, so one encoder and one decoder pass serve several jobs.
+
+    A batch is sent once `max_batch` windows are waiting or `max_wait` seconds
+    after its first window arrived, whichever comes first, so a lone job is
+    delayed by at most `max_wait` per window.
+
+    `model_lock` is held for every batched forward pass, so other callers on
+    the same model (language detection) never overlap with a batch: Whisper's
+    kv-cache hooks live on the shared modules.
+    """
+
+    def __init__(self, get_model: Callable[[], Any], fp16: bool = False,
+                 max_batch: Optional[int] = None, max_wait: Optional[float] = None,
+                 model_lock: Optional[threading.Lock] = None):
+        self.get_model = get_model
+        self.fp16 = fp16
+        self.model_lock = model_lock or threading.Lock()
+        self.max_batch = max_batch or int(os.getenv("WHISPER_BATCH_SIZE", "8"))
+        self.max_wait = max_wait if max_wait is not None else float(
+            os.getenv("WHISPER_BATCH_WAIT_MS", "50")) / 1000
+        self._queue: "queue.Queue[Tuple[torch.Tensor, float, Optional[str], Future]]" = queue.Queue()
+        self._thread: Optional[threading.Thread] = None
+        self._lock = threading.Lock()
+        self._batches = 0
+        self._windows = 0
+        self._largest = 0
+
+    def _ensure_thread(self) -> None:
+        with self._lock:
+            if self._thread is None:
+                self._thread = threading.Thread(
+                    target=self._run, name="whisper-batcher", daemon=True)
+                self._thread.start()
+
+    def decode(self, mel: torch.Tensor, temperature: float,
+               language: Optional[str] = None) -> whisper.DecodingResult:
+        """
+        Queue one window and block until its batch has been decoded.
+        """
+        self._ensure_thread()
+        future: Future = Future()
+        self._queue.put((mel, temperature, language, future))
+        return future.result()
+
+    def _collect(self) -> List[Tuple[torch.Tensor, float, Optional[str], Future]]:
+        batch = [self._queue.get()]
+        deadline = time.monotonic() + self.max_wait
+        while len(batch) < self.max_batch:
+            remaining = deadline - time.monotonic()
+            if remaining <= 0:
+                break
+            try:
+                batch.append(self._queue.get(timeout=remaining))
+            except queue.Empty:
+                break
+        return batch
+
+    def _run(self) -> None:
+        while True:
+            batch = []
+            try:
+                batch = self._collect()
+                # decoding options are per batch, so windows are grouped by
+                # fallback temperature and by the language of their job
+                groups: Dict[Tuple[float, Optional[str]], List[Tuple[torch.Tensor, Future]]] = {}
+                for mel, temperature, language, future in batch:
+                    groups.setdefault((temperature, language), []).append((mel, future))
+                for (temperature, language), items in groups.items():
+                    self._decode_group(temperature, language, items)
+            except Exception as e:
+                # a dead thread would leave every later decode() waiting forever
+                for *_, future in batch:
+                    if not future.done():
+                        future.set_exception(e)
+
+    def _decode_group(self, temperature: float, language: Optional[str],
+                      items: List[Tuple[torch.Tensor, Future]]) -> None:
+        try:
+            model = self.get_model()
+            mels = torch.stack([mel.to(model.device) for mel, _ in items])
+            with self.model_lock:
+                results = whisper.decode(model, mels, whisper.DecodingOptions(
+                    temperature=temperature, language=language, fp16=self.fp16))
+        except Exception as e:
+            for _, future in items:
+                future.set_exception(e)
+            return
+        with self._lock:
+            self._batches += 1
+            self._windows += len(items)
+            self._largest = max(self._largest, len(items))
+        for (_, future), result in zip(items, results):
+            future.set_result(result)
+
+    def stats(self) -> Dict[str, Any]:
+        with self._lock:
+            return {
+                "maxBatch": self.max_batch,
+                "maxWaitMs": self.max_wait * 1000,
+                "batches": self._batches,
+                "windows": self._windows,
+                "avgBatchSize": self._windows / self._batches if self._batches else 0.0,
+                "largestBatch": self._largest,
+                "queued": self._queue.qsize(),
+            }
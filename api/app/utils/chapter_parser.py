@@ -0,0 +1,174 @@
+import json
+import re
+import threading
+from typing import Any, Dict, List, Optional, Tuple
+
+from pydantic import BaseModel, ConfigDict, ValidationError
+
+from utils.json_stream import ChapterStreamParser
+
+
+class Chapter(BaseModel):
+    model_config = ConfigDict(extra="allow", coerce_numbers_to_str=True)
+
+    chapterNumber: Optional[int] = None
+    title: Optional[str] = None
+    content: Optional[str] = None
+    startTime: Optional[str] = None
+    endTime: Optional[str] = None
+    startSegment: Optional[int] = None
+
+
+class Metadata(BaseModel):
+    model_config = ConfigDict(extra="allow", coerce_numbers_to_str=True)
+
+    totalChapters: Optional[int] = None
+    mainTopics: List[str] = []
+
+
+class ChapterResponse(BaseModel):
+    model_config = ConfigDict(extra="allow", coerce_numbers_to_str=True)
+
+    chapters: List[Chapter]
+    metadata: Metadata = Metadata()
+
+
+class ParseStats:
+    """
+    Counters for how LLM responses were parsed, exposed on `/workers`.
+    """
+
+    def __init__(self):
+        self._lock = threading.Lock()
+        self.counts = {"responses": 0, "clean": 0, "repaired": 0, "partial": 0,
+                       "reasked": 0, "reaskRecovered": 0, "failed": 0}
+
+    def record(self, outcome: str) -> None:
+        with self._lock:
+            self.counts[outcome] += 1
+
+    def stats(self) -> Dict[str, Any]:
+        with self._lock:
+            counts = dict(self.counts)
+        responses = counts["responses"] or 1
+        counts["failureRate"] = counts["failed"] / responses
+        counts["repairRate"] = (counts["repaired"] + counts["partial"]) / responses
+        counts["reaskRate"] = counts["reasked"] / responses
+        return counts
+
+
+parse_stats = ParseStats()
+
+FENCE = re.compile(r"```(?:json)?\s*(.*?)\s*(?:```|$)", re.DOTALL)
+TRAILING_COMMA = re.compile(r",\s*([}\]])")
+MISSING_COMMA = re.compile(r"([}\]\"]|\d|true|false|null)(\s*\n\s*)(\"[^\"]+\"\s*:|\{)")
+SMART_QUOTES = str.maketrans({"“": '"', "”": '"', "‘": "'", "’": "'"})
+# only in value position, so the words are left alone inside strings
+PYTHON_LITERALS = [(re.compile(r"([:\[,]\s*)True\b"), r"\1true"),
+                   (re.compile(r"([:\[,]\s*)False\b"), r"\1false"),
+                   (re.compile(r"([:\[,]\s*)None\b"), r"\1null")]
+
+
+def extract_json(text: str) -> str:
+    """
+    Cut the JSON object out of a response that may wrap it in code fences or prose.
+    """
+    fenced = FENCE.search(text)
+    if fenced and "{" in fenced.group(1):
+        text = fenced.group(1)
+    starts = [idx for idx in (text.find("{"), text.find("[")) if idx >= 0]
+    if not starts:
+        return text.strip()
+    start = min(starts)
+    # a bare array of chapters is accepted too
+    end = text.rfind("]" if text[start] == "[" else "}")
+    return text[start:end + 1] if end > start else text[start:]
+
+
+def repair_json(text: str) -> str:
+    """
+    Fix the formatting defects LLMs commonly produce: smart quotes, Python
+    literals, trailing commas and missing commas between values.
+    """
+    text = text.translate(SMART_QUOTES)
+    for pattern, literal in PYTHON_LITERALS:
+        text = pattern.sub(literal, text)
+    text = TRAILING_COMMA.sub(r"\1", text)
+    return MISSING_COMMA.sub(r"\1,\2\3", text)
+
+
+def validate_chapters(data: Any, required_field: str = "content") -> Tuple[Optional[Dict[str, Any]], Optional[str]]:
+    """
+    Validate parsed JSON against the chapter schema.
+
+    Chapters without `required_field` are dropped; missing titles and numbers
+    are filled in. Returns (chapters, None) or (None, reason).
+    """
+    if isinstance(data, list):
+        # a bare chapter list instead of the wrapping object
+        data = {"chapters": data}
+    try:
+        response = ChapterResponse.model_validate(data)
+    except ValidationError as e:
+        return None, str(e)
+
+    chapters = [chapter for chapter in response.chapters
+                if getattr(chapter, required_field, None) not in (None, "")]
+    if not chapters:
+        return None, f'no chapter has a "{required_field}" field'
+    for number, chapter in enumerate(chapters, start=1):
+        if chapter.chapterNumber is None:
+            chapter.chapterNumber = number
+        if not chapter.title:
+            chapter.title = f"Chapter {number}"
+    response.chapters = chapters
+    response.metadata.totalChapters = len(chapters)
+    return response.model_dump(exclude_none=True), None
+
+
+def parse_chapter_response(text: str, required_field: str = "content") -> Tuple[Optional[Dict[str, Any]], str, Optional[str]]:
+    """
+    Parse an LLM chapter response as tolerantly as possible.
+
+    Tries the extracted JSON as is, then after repair, then falls back to the
+    complete chapter objects found before any truncation or garbage.
+    Returns (chapters, outcome, error) where outcome is "clean", "repaired",
+    "partial" or "failed".
+    """
+    raw = extract_json(text)
+    error = None
+    for outcome, candidate in (("clean", raw), ("repaired", repair_json(raw))):
+        try:
+            data = json.loads(candidate)
+        except json.JSONDecodeError as e:
+            error = f"invalid JSON: {e}"
+            continue
+        result, error = validate_chapters(data, required_field)
+        if result is not None:
+            return result, outcome, None
+
+    # keep whatever chapter objects are complete
+    parser = ChapterStreamParser()
+    parser.feed(repair_json(raw))
+    if parser.chapters:
+        result, _ = validate_chapters(parser.partial_result(), required_field)
+        if result is not None:
+            return result, "partial", error
+    return None, "failed", error
+
+
+def reask_prompt(raw: str, error: str, required_field: str = "content") -> str:
+    """
+    Short follow-up asking the model to fix its own output, without resending
+    the transcript.
+    """
+    fields = '"title", "startSegment"' if required_field == "startSegment" else \
+        '"chapterNumber", "title", "content", "startTime", "endTime"'
+    return f"""Your previous response could not be parsed: {error}
+
+Return the same chapters as a single valid JSON object of the form
+{{"chapters": [{{{fields}}}], "metadata": {{"totalChapters": number, "mainTopics": [strings]}}}}
+Respond with the JSON object only, no code fences or explanations.
+
+Previous response:
+{raw}"""
@@ -0,0 +1,272 @@
+import os
+import threading
+import time
+from abc import ABC, abstractmethod
+from typing import Any, Dict, List, Optional, Tuple
+
+import numpy as np
+
+from utils.model_registry import model_registry
+from utils.long_form import SAMPLE_RATE
+
+# (engine, model name, device, precision)
+EngineKey = Tuple[str, str, str, str]
+
+
+class EngineTimings:
+    """
+    Per-stage wall-clock totals for one engine, exposed on `/workers`.
+    """
+
+    def __init__(self):
+        self._lock = threading.Lock()
+        self.seconds: Dict[str, float] = {}
+        self.calls = 0
+        self.audio_seconds = 0.0
+
+    def record(self, stage: str, seconds: float) -> None:
+        with self._lock:
+            self.seconds[stage] = self.seconds.get(stage, 0.0) + seconds
+
+    def record_call(self, audio_seconds: float) -> None:
+        with self._lock:
+            self.calls += 1
+            self.audio_seconds += audio_seconds
+
+    def stats(self) -> Dict[str, Any]:
+        with self._lock:
+            busy = sum(seconds for stage, seconds in self.seconds.items() if stage != "load")
+            return {
+                "calls": self.calls,
+                "audioSeconds": self.audio_seconds,
+                "stageSeconds": dict(self.seconds),
+                # below 1 means faster than real time
+                "realTimeFactor": busy / self.audio_seconds if self.audio_seconds else 0.0,
+            }
+
+
+class TranscriptionEngine(ABC):
+    """
+    Base class for speech-to-text backends.
+
+    `transcribe` takes a 16 kHz mono float32 array and returns a Whisper-style
+    dict: `text` plus `segments` with id, seek, start, end, text, tokens,
+    temperature, avg_logprob, compression_ratio and no_speech_prob.
+    """
+
+    name = "base"
+
+    def __init__(self, model_name: str, device: str, precision: str,
+                 threads: Optional[int] = None):
+        self.model_name = model_name
+        self.device = device
+        self.precision = precision
+        self.threads = threads
+        self.timings = EngineTimings()
+
+    @property
+    def key(self) -> EngineKey:
+        return self.name, self.model_name, self.device, self.precision
+
+    def load(self) -> None:
+        """
+        Make sure the model is resident.
+        """
+
+    def transcribe(self, audio: np.ndarray, initial_prompt: Optional[str] = None) -> Dict[str, Any]:
+        self.timings.record_call(len(audio) / SAMPLE_RATE)
+        return self._transcribe(audio, initial_prompt)
+
+    @abstractmethod
+    def _transcribe(self, audio: np.ndarray, initial_prompt: Optional[str]) -> Dict[str, Any]:
+        ...
+
+    def stats(self) -> Dict[str, Any]:
+        return dict(self.timings.stats(), engine=self.name, model=self.model_name,
+                    device=self.device, precision=self.precision)
+
+
+class WhisperEngine(TranscriptionEngine):
+    """
+    openai-whisper in PyTorch; int8 applies dynamic quantization to the Linear layers on CPU.
+
+    With `WHISPER_BATCH_SIZE` above 1, the 30-second windows of every concurrent
+    transcription in the process are decoded together in batches.
+
+    Whisper keeps the decoder's kv-cache in forward hooks on the model's own
+    modules, so concurrent calls on one model corrupt each other. `lock`
+    serialises every forward pass on this engine's model.
+    """
+
+    name = "whisper"
+
+    def __init__(self, model_name: str, device: str, precision: str,
+                 threads: Optional[int] = None):
+        super().__init__(model_name, device, precision, threads)
+        self.lock = threading.Lock()
+        if threads:
+            import torch
+            torch.set_num_threads(threads)
+        self.batcher = None
+        if int(os.getenv("WHISPER_BATCH_SIZE", "1")) > 1:
+            from utils.batched_decoding import DecodeBatcher
+            self.batcher = DecodeBatcher(lambda: self.model, fp16=precision == "fp16",
+                                         model_lock=self.lock)
+
+    @property
+    def model(self):
+        # looked up on every use so the registry can still evict it
+        started_at = time.time()
+        loaded = (self.model_name, self.device, self.precision) in model_registry.loaded()
+        model = model_registry.get(self.model_name, self.device, self.precision)
+        if not loaded:
+            self.timings.record("load", time.time() - started_at)
+        return model
+
+    def load(self) -> None:
+        self.model
+
+    def _transcribe(self, audio: np.ndarray, initial_prompt: Optional[str]) -> Dict[str, Any]:
+        model = self.model
+        started_at = time.time()
+        if self.batcher is not None:
+            from utils.batched_decoding import transcribe_array
+            # batched windows are decoded without a text prompt, which is per batch
+            result = transcribe_array(model, audio, self.batcher)
+        else:
+            with self.lock:
+                result = model.transcribe(audio, fp16=self.precision == "fp16",
+                                          initial_prompt=initial_prompt)
+        self.timings.record("transcribe", time.time() - started_at)
+        return result
+
+    def stats(self) -> Dict[str, Any]:
+        stats = super().stats()
+        if self.batcher is not None:
+            stats["batching"] = self.batcher.stats()
+        return stats
+
+
+class FasterWhisperEngine(TranscriptionEngine):
+    """
+    CTranslate2 Whisper via the optional `faster-whisper` package, with int8 compute on CPU.
+    """
+
+    name = "faster-whisper"
+    COMPUTE_TYPES = {"fp32": "float32", "fp16": "float16", "int8": "int8"}
+
+    def __init__(self, model_name: str, device: str, precision: str,
+                 threads: Optional[int] = None):
+        super().__init__(model_name, device, precision, threads)
+        self._model = None
+        self._lock = threading.Lock()
+
+    @property
+    def model(self):
+        if self._model is None:
+            with self._lock:
+                if self._model is None:
+                    try:
+                        from faster_whisper import WhisperModel
+                    except ImportError:
+                        raise RuntimeError(
+                            "WHISPER_ENGINE=faster-whisper requires `pip install faster-whisper`")
+                    started_at = time.time()
+                    print(f"Loading faster-whisper model '{self.model_name}' on {self.device} ({self.precision})...")
+                    self._model = WhisperModel(
+                        self.model_name, device=self.device,
+                        compute_type=self.COMPUTE_TYPES[self.precision],
+                        cpu_threads=self.threads or 0)
+                    self.timings.record("load", time.time() - started_at)
+        return self._model
+
+    def load(self) -> None:
+        self.model
+
+    def _transcribe(self, audio: np.ndarray, initial_prompt: Optional[str]) -> Dict[str, Any]:
+        model = self.model
+        started_at = time.time()
+        # features, language detection and encoding of the first window happen here
+        generated, _ = model.transcribe(audio, initial_prompt=initial_prompt)
+        segments = []
+        first_at = None
+        for idx, segment in enumerate(generated):
+            if first_at is None:
+                first_at = time.time()
+            segments.append({
+                "id": idx,
+                "seek": segment.seek,
+                "start": segment.start,
+                "end": segment.end,
+                "text": segment.text,
+                "tokens": list(segment.tokens),
+                "temperature": segment.temperature,
+                "avg_logprob": segment.avg_logprob,
+                "compression_ratio": segment.compression_ratio,
+                "no_speech_prob": segment.no_speech_prob,
+            })
+        finished_at = time.time()
+        first_at = first_at or finished_at
+        self.timings.record("firstSegment", first_at - started_at)
+        self.timings.record("decode", finished_at - first_at)
+        return {"text": "".join(segment["text"] for segment in segments), "segments": segments}
+
+
+ENGINES = {engine.name: engine for engine in (WhisperEngine, FasterWhisperEngine)}
+_engines: Dict[EngineKey, TranscriptionEngine] = {}
+_engines_lock = threading.Lock()
+
+
+def resolve_engine_key(engine: Optional[str] = None,
+                       model_name: Optional[str] = None,
+                       device: Optional[str] = None,
+                       precision: Optional[str] = None) -> EngineKey:
+    """
+    Fill in the engine (`WHISPER_ENGINE`) and model defaults from the environment.
+    """
+    engine = engine or os.getenv("WHISPER_ENGINE", "whisper")
+    if engine not in ENGINES:
+        raise ValueError(f"Unsupported transcription engine: {engine}")
+    model_name, device, precision = model_registry.resolve_key(model_name, device, precision)
+    return engine, model_name, device, precision
+
+
+def get_engine(engine: Optional[str] = None,
+               model_name: Optional[str] = None,
+               device: Optional[str] = None,
+               precision: Optional[str] = None) -> TranscriptionEngine:
+    """
+    Return the shared engine for the given configuration, created once per process.
+    """
+    key = resolve_engine_key(engine, model_name, device, precision)
+    with _engines_lock:
+        if key not in _engines:
+            threads = int(os.getenv("WHISPER_THREADS", "0")) or None
+            _engines[key] = ENGINES[key[0]](*key[1:], threads=threads)
+        return _engines[key]
+
+
+def warm_up_engines(names: Optional[List[str]] = None) -> None:
+    """
+    Load the configured models for the configured engine ahead of traffic.
+    """
+    if resolve_engine_key()[0] == WhisperEngine.name:
+        model_registry.warm_up(names)
+        return
+    if names is None:
+        configured = os.getenv("WHISPER_WARMUP_MODELS", "")
+        names = [name.strip() for name in configured.split(",") if name.strip()] or [None]
+    for name in names:
+        get_engine(model_name=name).load()
+
+
+def engine_stats() -> List[Dict[str, Any]]:
+    with _engines_lock:
+        engines = list(_engines.values())
+    return [engine.stats() for engine in engines]
+
+
+def clear_engines() -> None:
+    with _engines_lock:
+        _engines.clear()
+    model_registry.clear()
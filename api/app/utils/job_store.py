@@ -0,0 +1,160 @@
+import json
+import os
+import threading
+import time
+import uuid
+from abc import ABC, abstractmethod
+from typing import Any, Dict, Optional
+
+from sqlalchemy import Column, Float, MetaData, String, Table, Text, create_engine, delete, insert, select, update
+
+# Job lifecycle: queued -> running -> done | failed
+# While running, `stage` is one of extracting, transcribing, chaptering, aligning
+JOB_FIELDS = ("jobId", "status", "stage", "progress", "filename", "error", "createdAt", "updatedAt")
+
+
+class JobStore(ABC):
+    """
+    Base class for job persistence. Jobs are plain dicts keyed by `jobId`.
+    """
+
+    def create(self, filename: Optional[str] = None) -> Dict[str, Any]:
+        now = time.time()
+        job = {
+            "jobId": uuid.uuid4().hex,
+            "status": "queued",
+            "stage": None,
+            "progress": 0.0,
+            "filename": filename,
+            "error": None,
+            "createdAt": now,
+            "updatedAt": now,
+            "result": None,
+        }
+        self._insert(job)
+        return self.get(job["jobId"])
+
+    @abstractmethod
+    def get(self, job_id: str) -> Optional[Dict[str, Any]]:
+        ...
+
+    @abstractmethod
+    def update(self, job_id: str, **fields) -> None:
+        ...
+
+    @abstractmethod
+    def delete(self, job_id: str) -> bool:
+        ...
+
+    @abstractmethod
+    def _insert(self, job: Dict[str, Any]) -> None:
+        ...
+
+
+class InMemoryJobStore(JobStore):
+    """
+    Process-local job store. Progress from process-pool workers is not visible here.
+    """
+
+    def __init__(self):
+        self._jobs: Dict[str, Dict[str, Any]] = {}
+        self._lock = threading.Lock()
+
+    def _insert(self, job: Dict[str, Any]) -> None:
+        with self._lock:
+            self._jobs[job["jobId"]] = job
+
+    def get(self, job_id: str) -> Optional[Dict[str, Any]]:
+        with self._lock:
+            job = self._jobs.get(job_id)
+            return dict(job) if job else None
+
+    def update(self, job_id: str, **fields) -> None:
+        with self._lock:
+            if job_id in self._jobs:
+                self._jobs[job_id].update(fields, updatedAt=time.time())
+
+    def delete(self, job_id: str) -> bool:
+        with self._lock:
+            return self._jobs.pop(job_id, None) is not None
+
+
+class SQLiteJobStore(JobStore):
+    """
+    Job store backed by SQLite through SQLAlchemy, shared across worker processes.
+    """
+
+    def __init__(self, url: str = "sqlite:///jobs.db"):
+        self.engine = create_engine(url, connect_args={"check_same_thread": False})
+        metadata = MetaData()
+        self.jobs = Table(
+            "jobs", metadata,
+            Column("jobId", String(32), primary_key=True),
+            Column("status", String(16), nullable=False),
+            Column("stage", String(16)),
+            Column("progress", Float, nullable=False, default=0.0),
+            Column("filename", Text),
+            Column("error", Text),
+            Column("createdAt", Float, nullable=False),
+            Column("updatedAt", Float, nullable=False),
+            Column("result", Text),
+        )
+        metadata.create_all(self.engine)
+
+    def _insert(self, job: Dict[str, Any]) -> None:
+        with self.engine.begin() as conn:
+            conn.execute(insert(self.jobs).values(**self._encode(job)))
+
+    def get(self, job_id: str) -> Optional[Dict[str, Any]]:
+        with self.engine.connect() as conn:
+            row = conn.execute(
+                select(self.jobs).where(self.jobs.c.jobId == job_id)).mappings().first()
+        if row is None:
+            return None
+        job = dict(row)
+        job["result"] = json.loads(job["result"]) if job["result"] else None
+        return job
+
+    def update(self, job_id: str, **fields) -> None:
+        fields["updatedAt"] = time.time()
+        with self.engine.begin() as conn:
+            conn.execute(
+                update(self.jobs).where(self.jobs.c.jobId == job_id).values(**self._encode(fields)))
+
+    def delete(self, job_id: str) -> bool:
+        with self.engine.begin() as conn:
+            result = conn.execute(delete(self.jobs).where(self.jobs.c.jobId == job_id))
+        return result.rowcount > 0
+
+    def _encode(self, fields: Dict[str, Any]) -> Dict[str, Any]:
+        if "result" in fields and fields["result"] is not None:
+            fields = dict(fields, result=json.dumps(fields["result"]))
+        return fields
+
+
+class JobProgress:
+    """
+    Picklable progress callback that records pipeline stages on a job.
+    """
+
+    def __init__(self, job_id: str):
+        self.job_id = job_id
+
+    def __call__(self, stage: str, fraction: float) -> None:
+        job_store.update(self.job_id, status="running", stage=stage,
+                         progress=round(fraction, 3))
+
+
+def create_job_store() -> JobStore:
+    """
+    Build the job store selected by `JOB_STORE` (memory or sqlite).
+    """
+    backend = os.getenv("JOB_STORE", "memory")
+    if backend == "memory":
+        return InMemoryJobStore()
+    if backend == "sqlite":
+        return SQLiteJobStore(os.getenv("JOB_STORE_URL", "sqlite:///jobs.db"))
+    raise ValueError(f"Unsupported job store: {backend}")
+
+
+job_store = create_job_store()
@@ -0,0 +1,93 @@
+import json
+import re
+from typing import Any, Dict, List
+
+CHAPTERS_ARRAY = re.compile(r'"chapters"\s*:\s*\[')
+
+
+class ChapterStreamParser:
+    """
+    Incremental parser for a streamed `{"chapters": [...], ...}` response.
+
+    Text is fed as it arrives; each chapter object is returned by `feed` as soon
+    as its closing brace is seen. The scan position is kept between calls, so
+    the whole response is scanned once no matter how it is chunked.
+    """
+
+    def __init__(self):
+        self.text = ""
+        self.chapters: List[Dict[str, Any]] = []
+        self._pos = -1  # scan position inside the chapters array, -1 until it is found
+        self._depth = 0
+        self._in_string = False
+        self._escape = False
+        self._object_start = 0
+        self._done = False
+
+    def feed(self, chunk: str) -> List[Dict[str, Any]]:
+        """
+        Add a chunk of response text and return the chapters it completed.
+        """
+        self.text += chunk
+        if self._done:
+            return []
+        if self._pos < 0:
+            match = CHAPTERS_ARRAY.search(self.text)
+            if not match:
+                return []
+            self._pos = match.end()
+
+        completed = []
+        text = self.text
+        pos = self._pos
+        while pos < len(text):
+            char = text[pos]
+            if self._in_string:
+                if self._escape:
+                    self._escape = False
+                elif char == "\\":
+                    self._escape = True
+                elif char == '"':
+                    self._in_string = False
+            elif char == '"':
+                self._in_string = True
+            elif char in "{[":
+                if self._depth == 0:
+                    self._object_start = pos
+                self._depth += 1
+            elif char in "}]":
+                if self._depth == 0:
+                    # closing bracket of the chapters array
+                    self._done = True
+                    pos += 1
+                    break
+                self._depth -= 1
+                if self._depth == 0:
+                    chapter = self._parse_object(text[self._object_start:pos + 1])
+                    if chapter is not None:
+                        self.chapters.append(chapter)
+                        completed.append(chapter)
+            pos += 1
+        self._pos = pos
+        return completed
+
+    def _parse_object(self, raw: str):
+        try:
+            value = json.loads(raw)
+        except json.JSONDecodeError:
+            print("Skipping malformed chapter:", raw[:200])
+            return None
+        return value if isinstance(value, dict) else None
+
+    def partial_result(self) -> Dict[str, Any]:
+        """
+        Response built from the chapters parsed so far, for output that never
+        became valid JSON as a whole.
+        """
+        return {
+            "chapters": list(self.chapters),
+            "metadata": {
+                "totalChapters": len(self.chapters),
+                "mainTopics": [],
+            }
+        }
@@ -0,0 +1,338 @@
+import json
+import os
+import random
+import re
+import threading
+import time
+from abc import ABC, abstractmethod
+from contextlib import contextmanager
+from typing import Any, Callable, Dict, Iterator, Optional
+
+import requests
+from requests.adapters import HTTPAdapter
+
+
+class LLMError(Exception):
+    """Raised when a chaptering backend fails after all retries."""
+
+
+class LLMClient(ABC):
+    """
+    Base class for chaptering backends.
+
+    Subclasses implement `_generate`; this class adds a per-backend concurrency
+    limit and retries transient failures with exponential backoff and jitter.
+    """
+
+    name = "base"
+
+    def __init__(self, timeout: Optional[float] = None,
+                 max_retries: Optional[int] = None,
+                 backoff: Optional[float] = None,
+                 concurrency: Optional[int] = None):
+        self.timeout = timeout or float(os.getenv("LLM_TIMEOUT", "300"))
+        self.max_retries = max_retries if max_retries is not None else int(
+            os.getenv("LLM_MAX_RETRIES", "3"))
+        self.backoff = backoff if backoff is not None else float(os.getenv("LLM_RETRY_BACKOFF", "1"))
+        self.concurrency = concurrency or int(os.getenv("LLM_CONCURRENCY", "4"))
+        self._slots = threading.BoundedSemaphore(self.concurrency)
+        self._lock = threading.Lock()
+        self._calls = 0
+        self._retries = 0
+        self._failures = 0
+        self._active = 0
+
+    @property
+    def model(self) -> Optional[str]:
+        return None
+
+    def fingerprint(self) -> Dict[str, Any]:
+        """
+        Backend and model, for cache keys.
+        """
+        return {"backend": self.name, "model": self.model}
+
+    @contextmanager
+    def _slot(self):
+        # blocks while `concurrency` calls to this backend are in flight
+        with self._slots:
+            with self._lock:
+                self._calls += 1
+                self._active += 1
+            try:
+                yield
+            finally:
+                with self._lock:
+                    self._active -= 1
+
+    def generate(self, prompt: str, system_instruction: Optional[str] = None,
+                 json_format: bool = True) -> str:
+        """
+        Send `prompt` to the backend and return the raw response text.
+        """
+        with self._slot():
+            return self._with_retries(
+                lambda: self._generate(prompt, system_instruction, json_format))
+
+    def stream(self, prompt: str, system_instruction: Optional[str] = None,
+               json_format: bool = True) -> Iterator[str]:
+        """
+        Yield the response text in chunks as the backend produces it.
+        Backends without streaming support yield the whole response at once.
+        """
+        yield self.generate(prompt, system_instruction, json_format)
+
+    def _with_retries(self, call: Callable[[], Any]) -> Any:
+        attempt = 0
+        while True:
+            try:
+                return call()
+            except Exception as e:
+                if attempt >= self.max_retries or not self.is_retryable(e):
+                    with self._lock:
+                        self._failures += 1
+                    raise LLMError(f"{self.name} request failed: {e}") from e
+                delay = self.backoff * (2 ** attempt) * (1 + random.random())
+                print(f"{self.name} request failed ({e}), retrying in {delay:.1f}s")
+                with self._lock:
+                    self._retries += 1
+                time.sleep(delay)
+                attempt += 1
+
+    @abstractmethod
+    def _generate(self, prompt: str, system_instruction: Optional[str],
+                  json_format: bool) -> str:
+        ...
+
+    def is_retryable(self, error: Exception) -> bool:
+        return False
+
+    def stats(self) -> Dict[str, Any]:
+        with self._lock:
+            return {
+                "backend": self.name,
+                "model": self.model,
+                "concurrency": self.concurrency,
+                "active": self._active,
+                "calls": self._calls,
+                "retries": self._retries,
+                "failures": self._failures,
+            }
+
+    def close(self) -> None:
+        pass
+
+
+class GeminiClient(LLMClient):
+    """
+    Google Gemini backend. The SDK is configured once and one `GenerativeModel`
+    is kept per system instruction, so its transport is reused across calls.
+    """
+
+    name = "gemini"
+
+    def __init__(self, api_key: Optional[str] = None, model_name: Optional[str] = None, **kwargs):
+        super().__init__(**kwargs)
+        import google.generativeai as genai
+
+        self._genai = genai
+        self.model_name = model_name or os.getenv("GEMINI_MODEL")
+        genai.configure(api_key=api_key or os.getenv("GEMINI_API_KEY"))
+        self._models: Dict[Optional[str], Any] = {}
+
+    @property
+    def model(self) -> Optional[str]:
+        return self.model_name
+
+    def _get_model(self, system_instruction: Optional[str]):
+        with self._lock:
+            if system_instruction not in self._models:
+                self._models[system_instruction] = self._genai.GenerativeModel(
+                    model_name=self.model_name,
+                    system_instruction=system_instruction,
+                )
+            return self._models[system_instruction]
+
+    def _generate(self, prompt: str, system_instruction: Optional[str],
+                  json_format: bool) -> str:
+        model = self._get_model(system_instruction)
+        response = model.generate_content(prompt, request_options={"timeout": self.timeout})
+        return response.text
+
+    def is_retryable(self, error: Exception) -> bool:
+        from google.api_core import exceptions
+
+        return isinstance(error, (exceptions.TooManyRequests, exceptions.ResourceExhausted,
+                                  exceptions.ServiceUnavailable, exceptions.DeadlineExceeded,
+                                  exceptions.InternalServerError))
+
+
+class OllamaClient(LLMClient):
+    """
+    Self-hosted Ollama backend over a pooled `requests.Session`.
+    """
+
+    name = "ollama"
+
+    def __init__(self, url: Optional[str] = None, model_name: Optional[str] = None,
+                 pool_size: Optional[int] = None, **kwargs):
+        super().__init__(**kwargs)
+        self.url = (url or os.getenv("OLLAMA_API") or "http://localhost:11434").rstrip("/")
+        self.model_name = model_name or os.getenv("OLLAMA_MODEL")
+        pool_size = pool_size or int(os.getenv("LLM_POOL_SIZE", str(self.concurrency)))
+        self.session = requests.Session()
+        self.session.headers.update({"Content-Type": "application/json"})
+        adapter = HTTPAdapter(pool_connections=1, pool_maxsize=pool_size)
+        self.session.mount("http://", adapter)
+        self.session.mount("https://", adapter)
+
+    @property
+    def model(self) -> Optional[str]:
+        return self.model_name
+
+    def _request(self, prompt: str, system_instruction: Optional[str],
+                 json_format: bool, stream: bool) -> Dict[str, Any]:
+        ollama_rq = {
+            "model": self.model_name,
+            "prompt": prompt,
+            "stream": stream,
+        }
+        if system_instruction:
+            ollama_rq["system"] = system_instruction
+        if json_format:
+            ollama_rq["format"] = "json"
+        return ollama_rq
+
+    def _generate(self, prompt: str, system_instruction: Optional[str],
+                  json_format: bool) -> str:
+        response = self.session.post(
+            self.url + "/api/generate", timeout=self.timeout,
+            json=self._request(prompt, system_instruction, json_format, stream=False))
+        response.raise_for_status()
+        return response.json()["response"]
+
+    def _open_stream(self, prompt: str, system_instruction: Optional[str],
+                     json_format: bool) -> requests.Response:
+        response = self.session.post(
+            self.url + "/api/generate", timeout=self.timeout, stream=True,
+            json=self._request(prompt, system_instruction, json_format, stream=True))
+        response.raise_for_status()
+        return response
+
+    def stream(self, prompt: str, system_instruction: Optional[str] = None,
+               json_format: bool = True) -> Iterator[str]:
+        """
+        Yield tokens as Ollama generates them. Only opening the stream is
+        retried; a failure part way through raises `LLMError`.
+        """
+        with self._slot():
+            response = self._with_retries(
+                lambda: self._open_stream(prompt, system_instruction, json_format))
+            try:
+                # one JSON object per line: {"response": "<tokens>", "done": false}
+                for line in response.iter_lines():
+                    if not line:
+                        continue
+                    data = json.loads(line)
+                    if "error" in data:
+                        raise LLMError(f"ollama stream failed: {data['error']}")
+                    yield data.get("response", "")
+                    if data.get("done"):
+                        break
+            except (requests.exceptions.RequestException, ValueError) as e:
+                with self._lock:
+                    self._failures += 1
+                raise LLMError(f"ollama stream failed: {e}") from e
+            finally:
+                response.close()
+
+    def is_retryable(self, error: Exception) -> bool:
+        if isinstance(error, (requests.exceptions.ConnectionError, requests.exceptions.Timeout)):
+            return True
+        if isinstance(error, requests.exceptions.HTTPError) and error.response is not None:
+            return error.response.status_code == 429 or error.response.status_code >= 500
+        return False
+
+    def close(self) -> None:
+        self.session.close()
+
+
+class StubClient(LLMClient):
+    """
+    Offline backend for load tests: answers instantly (or after `latency`
+    seconds) with one chapter per `chapter_lines` transcript lines.
+    """
+
+    name = "stub"
+    line_pattern = re.compile(r"^\[([^\]]+)\]\s*(.*)$")
+
+    def __init__(self, latency: Optional[float] = None, chapter_lines: Optional[int] = None, **kwargs):
+        super().__init__(**kwargs)
+        self.latency = latency if latency is not None else float(os.getenv("LLM_STUB_LATENCY", "0"))
+        self.chapter_lines = chapter_lines or int(os.getenv("LLM_STUB_CHAPTER_LINES", "20"))
+
+    @property
+    def model(self) -> Optional[str]:
+        return f"stub-{self.chapter_lines}"
+
+    def _generate(self, prompt: str, system_instruction: Optional[str],
+                  json_format: bool) -> str:
+        if self.latency:
+            time.sleep(self.latency)
+        lines = []
+        for line in prompt.splitlines():
+            match = self.line_pattern.match(line.strip())
+            if match:
+                lines.append(match.groups())
+        if not lines:
+            lines = [("0:00:00", prompt.strip())]
+
+        by_segment = "startSegment" in (system_instruction or "")
+        chapters = []
+        for number, idx in enumerate(range(0, len(lines), self.chapter_lines), start=1):
+            block = lines[idx:idx + self.chapter_lines]
+            title = " ".join(block[0][1].split()[:8]) or f"Chapter {number}"
+            if by_segment:
+                chapters.append({"title": title, "startSegment": int(block[0][0])})
+            else:
+                chapters.append({
+                    "chapterNumber": number,
+                    "title": title,
+                    "content": " ".join(text for _, text in block),
+                    "startTime": block[0][0],
+                    "endTime": block[-1][0],
+                })
+        return json.dumps({
+            "chapters": chapters,
+            "metadata": {"totalChapters": len(chapters), "mainTopics": []},
+        })
+
+
+LLM_BACKENDS = {
+    "gemini": GeminiClient,
+    "ollama": OllamaClient,
+    "stub": StubClient,
+}
+
+_clients: Dict[str, LLMClient] = {}
+_clients_lock = threading.Lock()
+
+
+def get_llm_client(backend: Optional[str] = None) -> LLMClient:
+    """
+    Shared client for `backend` (default `LLM_BACKEND`), created on first use.
+    """
+    backend = backend or os.getenv("LLM_BACKEND", "gemini")
+    if backend not in LLM_BACKENDS:
+        raise ValueError(f"Unsupported LLM backend: {backend}")
+    with _clients_lock:
+        if backend not in _clients:
+            _clients[backend] = LLM_BACKENDS[backend]()
+        return _clients[backend]
+
+
+def close_llm_clients() -> None:
+    with _clients_lock:
+        for client in _clients.values():
+            client.close()
+        _clients.clear()
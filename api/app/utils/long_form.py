@@ -0,0 +1,186 @@
+import multiprocessing
+import os
+from concurrent.futures import ProcessPoolExecutor
+from typing import Any, Callable, Dict, List, Optional, Tuple
+
+import numpy as np
+
+SAMPLE_RATE = 16000
+# 20 ms frames for the energy envelope used to find silence
+FRAME_SECONDS = 0.02
+
+
+def frame_energy(audio: np.ndarray, sample_rate: int = SAMPLE_RATE) -> np.ndarray:
+    """
+    RMS energy of consecutive fixed-size frames of a mono signal.
+    """
+    frame = max(1, int(sample_rate * FRAME_SECONDS))
+    usable = len(audio) - len(audio) % frame
+    frames = audio[:usable].reshape(-1, frame)
+    return np.sqrt(np.mean(np.square(frames, dtype=np.float32), axis=1))
+
+
+def find_split_points(audio: np.ndarray, window_seconds: float,
+                      search_seconds: float = 10.0,
+                      sample_rate: int = SAMPLE_RATE) -> List[float]:
+    """
+    Pick cut points roughly every `window_seconds`, moved to the quietest frame
+    within `search_seconds` of each target so words are not cut in half.
+    Returns the boundaries in seconds, including 0 and the total duration.
+    """
+    duration = len(audio) / sample_rate
+    if duration <= window_seconds:
+        return [0.0, duration]
+
+    energy = frame_energy(audio, sample_rate)
+    search = int(search_seconds / FRAME_SECONDS)
+    cuts = [0.0]
+    target = window_seconds
+    while target < duration - search_seconds:
+        center = int(target / FRAME_SECONDS)
+        lo = max(int(cuts[-1] / FRAME_SECONDS) + 1, center - search)
+        hi = min(len(energy), center + search + 1)
+        if lo >= hi:
+            cut = target
+        else:
+            cut = (lo + int(np.argmin(energy[lo:hi]))) * FRAME_SECONDS
+        cuts.append(cut)
+        target = cut + window_seconds
+    cuts.append(duration)
+    return cuts
+
+
+def plan_windows(cuts: List[float], overlap_seconds: float) -> List[Tuple[float, float, float, float]]:
+    """
+    Turn cut points into overlapping windows.
+    Each window is (start, end, own_start, own_end); only segments centred in
+    the owned range are kept when stitching.
+    """
+    duration = cuts[-1]
+    windows = []
+    for own_start, own_end in zip(cuts[:-1], cuts[1:]):
+        start = max(0.0, own_start - overlap_seconds)
+        end = min(duration, own_end + overlap_seconds)
+        windows.append((start, end, own_start, own_end))
+    return windows
+
+
+def own_segments(window: Tuple[float, float, float, float],
+                 segments: List[Dict[str, Any]],
+                 is_last: bool = False) -> List[Dict[str, Any]]:
+    """
+    Keep the segments of a window whose midpoint lies in the range the window owns.
+    """
+    _, _, own_start, own_end = window
+    kept = []
+    for segment in segments:
+        middle = (segment["start"] + segment["end"]) / 2
+        # the last window also keeps segments Whisper places past the end
+        if own_start <= middle and (middle < own_end or is_last):
+            kept.append(segment)
+    kept.sort(key=lambda segment: segment["start"])
+    return kept
+
+
+def stitch_segments(window_results: List[Tuple[Tuple[float, float, float, float], List[Dict[str, Any]]]]) -> List[Dict[str, Any]]:
+    """
+    Merge per-window segments (already on the global timeline) into one list,
+    dropping duplicates from the overlaps and renumbering ids.
+    """
+    stitched = []
+    for idx, (window, segments) in enumerate(window_results):
+        stitched.extend(own_segments(window, segments, idx == len(window_results) - 1))
+    for idx, segment in enumerate(stitched):
+        segment["id"] = idx
+    return stitched
+
+
+def transcribe_window(engine, audio: np.ndarray, offset: float,
+                      initial_prompt: Optional[str] = None) -> List[Dict[str, Any]]:
+    """
+    Transcribe one window of audio with a transcription engine and shift its
+    segments onto the global timeline.
+    """
+    result = engine.transcribe(audio, initial_prompt=initial_prompt)
+    segments = result["segments"]
+    for segment in segments:
+        segment["start"] += offset
+        segment["end"] += offset
+        segment["seek"] += int(round(offset * 100))
+    return segments
+
+
+def _init_worker(threads: int) -> None:
+    import torch
+    torch.set_num_threads(threads)
+
+
+def _transcribe_window(audio: np.ndarray, offset: float,
+                       engine_key: Tuple[str, str, str, str]) -> List[Dict[str, Any]]:
+    # Runs in a worker process; each worker keeps its own engine and model
+    from utils.engines import get_engine
+
+    return transcribe_window(get_engine(*engine_key), audio, offset)
+
+
+class LongFormTranscriber:
+    """
+    Transcribe long audio by splitting it at silences into overlapping windows
+    and decoding the windows in parallel worker processes.
+    """
+
+    def __init__(self, workers: Optional[int] = None,
+                 window_seconds: Optional[float] = None,
+                 overlap_seconds: Optional[float] = None):
+        self.workers = workers or int(
+            os.getenv("WHISPER_LONG_FORM_WORKERS", str(os.cpu_count() or 1)))
+        self.window_seconds = window_seconds or float(os.getenv("WHISPER_WINDOW_SECONDS", "300"))
+        self.overlap_seconds = overlap_seconds if overlap_seconds is not None else float(
+            os.getenv("WHISPER_WINDOW_OVERLAP", "5"))
+        self._executor: Optional[ProcessPoolExecutor] = None
+
+    def _get_executor(self) -> ProcessPoolExecutor:
+        if self._executor is None:
+            # spawn: forking a process that already holds torch state is unsafe
+            threads = max(1, (os.cpu_count() or 1) // self.workers)
+            self._executor = ProcessPoolExecutor(
+                max_workers=self.workers,
+                mp_context=multiprocessing.get_context("spawn"),
+                initializer=_init_worker, initargs=(threads,))
+        return self._executor
+
+    def transcribe(self, audio: np.ndarray, engine_key: Tuple[str, str, str, str],
+                   on_segments: Optional[Callable[[List[Dict[str, Any]]], None]] = None) -> Dict[str, Any]:
+        """
+        Transcribe a 16 kHz mono float32 array and return a Whisper-style result dict.
+        `on_segments` receives each window's stitched segments, in order, as soon as they are ready.
+        """
+        cuts = find_split_points(audio, self.window_seconds)
+        windows = plan_windows(cuts, self.overlap_seconds)
+        executor = self._get_executor()
+        futures = [
+            executor.submit(_transcribe_window,
+                            audio[int(start * SAMPLE_RATE):int(end * SAMPLE_RATE)],
+                            start, engine_key)
+            for start, end, _, _ in windows
+        ]
+        segments = []
+        for idx, (window, future) in enumerate(zip(windows, futures)):
+            kept = own_segments(window, future.result(), idx == len(windows) - 1)
+            for segment in kept:
+                segment["id"] = len(segments)
+                segments.append(segment)
+            if on_segments and kept:
+                on_segments(kept)
+        return {
+            "text": "".join(segment["text"] for segment in segments),
+            "segments": segments,
+        }
+
+    def shutdown(self) -> None:
+        if self._executor is not None:
+            self._executor.shutdown(wait=False, cancel_futures=True)
+            self._executor = None
+
+
+long_form_transcriber = LongFormTranscriber()
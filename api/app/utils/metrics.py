@@ -0,0 +1,216 @@
+import contextvars
+import os
+import sys
+import threading
+import time
+from contextlib import contextmanager
+from typing import Any, Dict, Iterator, List, Optional
+
+try:
+    import resource
+except ImportError:  # Windows
+    resource = None
+
+_current_trace: contextvars.ContextVar = contextvars.ContextVar("trace", default=None)
+_current_collector: contextvars.ContextVar = contextvars.ContextVar("collector", default=None)
+
+
+def rss_bytes() -> Optional[int]:
+    """
+    Current resident set size of this process, or None where /proc is unavailable.
+    """
+    try:
+        with open("/proc/self/statm") as statm:
+            return int(statm.read().split()[1]) * os.sysconf("SC_PAGE_SIZE")
+    except (OSError, ValueError, IndexError):
+        return None
+
+
+def peak_rss_bytes() -> Optional[int]:
+    """
+    Peak resident set size of this process so far.
+    """
+    if resource is None:
+        return None
+    peak = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+    # kilobytes on Linux, bytes on macOS
+    return peak if sys.platform == "darwin" else peak * 1024
+
+
+class StageMetrics:
+    """
+    Process-wide stage timings and audio totals, rendered for `/metrics`.
+    With a process pool, each job's stages are collected in the worker and
+    merged into the parent's totals when the job returns.
+    """
+
+    def __init__(self):
+        self._lock = threading.Lock()
+        self.counts: Dict[str, int] = {}
+        self.sums: Dict[str, float] = {}
+        self.maxes: Dict[str, float] = {}
+        self.audio_seconds = 0.0
+
+    def record(self, stage: str, seconds: float) -> None:
+        with self._lock:
+            self.counts[stage] = self.counts.get(stage, 0) + 1
+            self.sums[stage] = self.sums.get(stage, 0.0) + seconds
+            self.maxes[stage] = max(self.maxes.get(stage, 0.0), seconds)
+
+    def add_audio(self, seconds: float) -> None:
+        with self._lock:
+            self.audio_seconds += seconds
+
+    def export(self) -> Dict[str, Any]:
+        """
+        Picklable copy of the totals, for `merge` in another process.
+        """
+        with self._lock:
+            return {"counts": dict(self.counts), "sums": dict(self.sums),
+                    "maxes": dict(self.maxes), "audioSeconds": self.audio_seconds}
+
+    def merge(self, exported: Dict[str, Any]) -> None:
+        """
+        Add totals exported by another process, e.g. a process-pool worker.
+        """
+        with self._lock:
+            for stage, count in exported["counts"].items():
+                self.counts[stage] = self.counts.get(stage, 0) + count
+                self.sums[stage] = self.sums.get(stage, 0.0) + exported["sums"][stage]
+                self.maxes[stage] = max(self.maxes.get(stage, 0.0), exported["maxes"][stage])
+            self.audio_seconds += exported["audioSeconds"]
+
+    def render(self) -> str:
+        """
+        Prometheus text exposition format.
+        """
+        with self._lock:
+            counts, sums, maxes = dict(self.counts), dict(self.sums), dict(self.maxes)
+            audio_seconds = self.audio_seconds
+        lines = [
+            "# HELP analyzer_stage_seconds Wall-clock time spent in each pipeline stage.",
+            "# TYPE analyzer_stage_seconds summary",
+        ]
+        for stage in sorted(counts):
+            lines.append(f'analyzer_stage_seconds_count{{stage="{stage}"}} {counts[stage]}')
+            lines.append(f'analyzer_stage_seconds_sum{{stage="{stage}"}} {sums[stage]}')
+        lines += [
+            "# HELP analyzer_stage_seconds_max Longest single run of each pipeline stage.",
+            "# TYPE analyzer_stage_seconds_max gauge",
+        ]
+        for stage in sorted(maxes):
+            lines.append(f'analyzer_stage_seconds_max{{stage="{stage}"}} {maxes[stage]}')
+        lines += [
+            "# HELP analyzer_audio_seconds_total Seconds of audio decoded for transcription.",
+            "# TYPE analyzer_audio_seconds_total counter",
+            f"analyzer_audio_seconds_total {audio_seconds}",
+            "# HELP analyzer_real_time_factor Whisper seconds per second of audio (below 1 is faster than real time).",
+            "# TYPE analyzer_real_time_factor gauge",
+            f"analyzer_real_time_factor {sums.get('whisper', 0.0) / audio_seconds if audio_seconds else 0.0}",
+        ]
+        for name, value, help_text in (
+                ("process_resident_memory_bytes", rss_bytes(), "Resident memory size in bytes."),
+                ("process_peak_resident_memory_bytes", peak_rss_bytes(), "Peak resident memory size in bytes.")):
+            if value is not None:
+                lines += [f"# HELP {name} {help_text}", f"# TYPE {name} gauge", f"{name} {value}"]
+        return "\n".join(lines) + "\n"
+
+
+stage_metrics = StageMetrics()
+
+
+class RequestTrace:
+    """
+    Timing spans of one request, returned in the response when asked for.
+    """
+
+    def __init__(self):
+        self.spans: List[Dict[str, Any]] = []
+        self.audio_seconds: Optional[float] = None
+
+    def add(self, stage: str, seconds: float) -> None:
+        self.spans.append({"stage": stage, "seconds": seconds, "rssBytes": rss_bytes()})
+
+    def merge(self, timings: Optional[Dict[str, Any]]) -> None:
+        """
+        Add the spans of a trace recorded elsewhere, e.g. on a worker.
+        """
+        if not timings:
+            return
+        self.spans.extend(timings["spans"])
+        if timings.get("audioSeconds") is not None:
+            self.audio_seconds = timings["audioSeconds"]
+
+    def to_dict(self) -> Dict[str, Any]:
+        stages: Dict[str, float] = {}
+        for recorded in self.spans:
+            stages[recorded["stage"]] = stages.get(recorded["stage"], 0.0) + recorded["seconds"]
+        audio = self.audio_seconds
+
+        def factor(stage: str) -> Optional[float]:
+            return stages[stage] / audio if audio and stage in stages else None
+
+        return {
+            "spans": self.spans,
+            "stages": stages,
+            "audioSeconds": audio,
+            "realTimeFactor": factor("whisper"),
+            "pipelineRealTimeFactor": factor("analysis"),
+            "peakRssBytes": peak_rss_bytes(),
+        }
+
+
+@contextmanager
+def tracing(trace: Optional[RequestTrace]) -> Iterator[Optional[RequestTrace]]:
+    """
+    Record the spans of the enclosed code into `trace` (None records metrics only).
+    """
+    token = _current_trace.set(trace)
+    try:
+        yield trace
+    finally:
+        _current_trace.reset(token)
+
+
+@contextmanager
+def collecting(collector: StageMetrics) -> Iterator[StageMetrics]:
+    """
+    Also record the stage metrics of the enclosed code into `collector`.
+    """
+    token = _current_collector.set(collector)
+    try:
+        yield collector
+    finally:
+        _current_collector.reset(token)
+
+
+@contextmanager
+def span(stage: str) -> Iterator[None]:
+    """
+    Time a pipeline stage into the process metrics and the active request trace.
+    """
+    started_at = time.perf_counter()
+    try:
+        yield
+    finally:
+        seconds = time.perf_counter() - started_at
+        stage_metrics.record(stage, seconds)
+        collector = _current_collector.get()
+        if collector is not None:
+            collector.record(stage, seconds)
+        trace = _current_trace.get()
+        if trace is not None:
+            trace.add(stage, seconds)
+
+
+def record_audio(seconds: float) -> None:
+    """
+    Note the duration of the audio being transcribed, for real-time factors.
+    """
+    stage_metrics.add_audio(seconds)
+    collector = _current_collector.get()
+    if collector is not None:
+        collector.add_audio(seconds)
+    trace = _current_trace.get()
+    if trace is not None:
+        trace.audio_seconds = seconds
@@ -0,0 +1,174 @@
+import os
+import threading
+from collections import OrderedDict
+from typing import Dict, List, Optional, Tuple
+
+import torch
+import whisper
+
+ModelKey = Tuple[str, str, str]
+
+
+def quantize_int8(model: whisper.Whisper) -> whisper.Whisper:
+    """
+    int8 weights for the Linear layers, activations quantized on the fly.
+    """
+    from torch.ao.nn.quantized.dynamic import Linear as DynamicLinear
+
+    # Whisper's projections are whisper.model.Linear; quantize_dynamic only
+    # swaps modules whose type is exactly nn.Linear, so swap them to plain
+    # nn.Linear (sharing the weights) first
+    for parent in list(model.modules()):
+        for name, child in list(parent.named_children()):
+            if isinstance(child, whisper.model.Linear):
+                plain = torch.nn.Linear(child.in_features, child.out_features,
+                                        bias=child.bias is not None, device="meta")
+                plain.weight = child.weight
+                plain.bias = child.bias
+                setattr(parent, name, plain)
+
+    model = torch.quantization.quantize_dynamic(model, {torch.nn.Linear}, dtype=torch.qint8)
+    quantized = sum(isinstance(module, DynamicLinear) for module in model.modules())
+    if not quantized:
+        raise RuntimeError("int8 quantization left every Linear layer in fp32")
+    print(f"Quantized {quantized} Linear layers to int8")
+    return model
+
+
+class ModelRegistry:
+    """
+    Process-wide cache of loaded Whisper models, keyed by (name, device, precision).
+    Precision is fp32, fp16 (GPU only) or int8 (dynamically quantized, CPU only).
+
+    Models are loaded lazily on first use and shared by every caller in the process.
+    At most `max_models` stay resident; the least recently used one is evicted first.
+    """
+
+    def __init__(self, max_models: Optional[int] = None):
+        self._max_models = max_models
+        self._models: "OrderedDict[ModelKey, whisper.Whisper]" = OrderedDict()
+        self._lock = threading.Lock()
+        self._load_locks: Dict[ModelKey, threading.Lock] = {}
+
+    @property
+    def max_models(self) -> int:
+        # read lazily so values from .env (loaded after import) are honoured
+        if self._max_models is None:
+            return max(1, int(os.getenv("WHISPER_MAX_MODELS", "2")))
+        return max(1, self._max_models)
+
+    def resolve_key(self, name: Optional[str] = None,
+                    device: Optional[str] = None,
+                    precision: Optional[str] = None) -> ModelKey:
+        """
+        Fill in defaults from the environment and return the registry key.
+        """
+        name = name or os.getenv("WHISPER_MODEL", "base")
+        device = device or os.getenv("WHISPER_DEVICE") or (
+            "cuda" if torch.cuda.is_available() else "cpu")
+        precision = precision or os.getenv("WHISPER_PRECISION", "fp32")
+        if precision not in ("fp32", "fp16", "int8"):
+            raise ValueError(f"Unsupported Whisper precision: {precision}")
+        # fp16 inference is only supported by Whisper on GPU
+        if device == "cpu" and precision == "fp16":
+            precision = "fp32"
+        return name, device, precision
+
+    def get(self, name: Optional[str] = None,
+            device: Optional[str] = None,
+            precision: Optional[str] = None) -> whisper.Whisper:
+        """
+        Return the shared model for the given configuration, loading it once if needed.
+        """
+        key = self.resolve_key(name, device, precision)
+
+        with self._lock:
+            model = self._models.get(key)
+            if model is not None:
+                self._models.move_to_end(key)
+                return model
+            load_lock = self._load_locks.setdefault(key, threading.Lock())
+
+        # Load outside the registry lock so other models stay available meanwhile
+        with load_lock:
+            with self._lock:
+                model = self._models.get(key)
+                if model is not None:
+                    self._models.move_to_end(key)
+                    return model
+
+            model_name, model_device, model_precision = key
+            if model_precision == "int8" and model_device != "cpu":
+                raise ValueError("int8 Whisper models are only supported on cpu")
+            print(f"Loading Whisper model '{model_name}' on {model_device} ({model_precision})...")
+            model = whisper.load_model(model_name, device=model_device)
+            if model_precision == "fp16":
+                model = model.half()
+            elif model_precision == "int8":
+                model = quantize_int8(model)
+            model.eval()
+
+            with self._lock:
+                self._models[key] = model
+                self._evict_locked()
+            return model
+
+    def warm_up(self, names: Optional[List[str]] = None) -> None:
+        """
+        Load the given models (or the configured `WHISPER_WARMUP_MODELS`) ahead of traffic.
+        """
+        if names is None:
+            configured = os.getenv("WHISPER_WARMUP_MODELS", "")
+            names = [name.strip() for name in configured.split(",") if name.strip()]
+            if not names:
+                names = [os.getenv("WHISPER_MODEL", "base")]
+        for name in names:
+            self.get(name)
+
+    def unload(self, name: Optional[str] = None,
+               device: Optional[str] = None,
+               precision: Optional[str] = None) -> bool:
+        """
+        Drop a model from the registry. Returns True if it was loaded.
+        """
+        key = self.resolve_key(name, device, precision)
+        with self._lock:
+            model = self._models.pop(key, None)
+            self._load_locks.pop(key, None)
+        if model is None:
+            return False
+        self._release(key, model)
+        return True
+
+    def clear(self) -> None:
+        """
+        Unload every model held by the registry.
+        """
+        with self._lock:
+            models = list(self._models.items())
+            self._models.clear()
+            self._load_locks.clear()
+        for key, model in models:
+            self._release(key, model)
+
+    def loaded(self) -> List[ModelKey]:
+        """
+        Return the keys of the currently resident models, least recently used first.
+        """
+        with self._lock:
+            return list(self._models.keys())
+
+    def _evict_locked(self) -> None:
+        while len(self._models) > self.max_models:
+            key, model = self._models.popitem(last=False)
+            self._load_locks.pop(key, None)
+            self._release(key, model)
+
+    def _release(self, key: ModelKey, model: whisper.Whisper) -> None:
+        print(f"Unloading Whisper model '{key[0]}' from {key[1]} ({key[2]})")
+        del model
+        if key[1].startswith("cuda") and torch.cuda.is_available():
+            torch.cuda.empty_cache()
+
+
+model_registry = ModelRegistry()
@@ -0,0 +1,152 @@
+import hashlib
+import json
+import os
+import threading
+import time
+from typing import Any, Dict, Optional
+
+from sqlalchemy import Column, Float, Integer, MetaData, String, Table, Text, create_engine, delete, func, insert, select, update
+
+
+def make_cache_key(content_hash: str, fingerprint: str) -> str:
+    """
+    Combine the upload's content hash with the pipeline configuration fingerprint.
+    """
+    return hashlib.sha256(f"{content_hash}:{fingerprint}".encode()).hexdigest()
+
+
+class ResultCache:
+    """
+    SQLite-backed cache of analysis results, keyed by content hash and configuration.
+
+    Entries older than `max_age` seconds are dropped, and the least recently used
+    entries are evicted once the stored payloads exceed `max_bytes`.
+    """
+
+    def __init__(self, url: str = "sqlite:///result_cache.db",
+                 max_bytes: int = 1024 ** 3,
+                 max_age: float = 7 * 24 * 3600):
+        self.max_bytes = max_bytes
+        self.max_age = max_age
+        # whole-result lookups, one per request
+        self.hits = 0
+        self.misses = 0
+        # pipeline stage lookups, per stage
+        self.stage_hits: Dict[str, int] = {}
+        self.stage_misses: Dict[str, int] = {}
+        self._lock = threading.Lock()
+        self.engine = create_engine(url, connect_args={"check_same_thread": False})
+        metadata = MetaData()
+        self.entries = Table(
+            "results", metadata,
+            Column("key", String(64), primary_key=True),
+            Column("contentHash", String(64), nullable=False, index=True),
+            Column("value", Text, nullable=False),
+            Column("size", Integer, nullable=False),
+            Column("createdAt", Float, nullable=False),
+            Column("accessedAt", Float, nullable=False),
+        )
+        metadata.create_all(self.engine)
+
+    def get(self, key: str, stage: Optional[str] = None) -> Optional[Any]:
+        """
+        Cached value for `key`, or None. Lookups of a pipeline `stage` are
+        counted per stage, apart from the whole-result hit rate.
+        """
+        now = time.time()
+        with self.engine.begin() as conn:
+            row = conn.execute(
+                select(self.entries.c.value, self.entries.c.createdAt)
+                .where(self.entries.c.key == key)).first()
+            if row is not None and self.max_age and now - row.createdAt > self.max_age:
+                conn.execute(delete(self.entries).where(self.entries.c.key == key))
+                row = None
+            if row is not None:
+                conn.execute(update(self.entries).where(self.entries.c.key == key)
+                             .values(accessedAt=now))
+        with self._lock:
+            if stage is not None:
+                counters = self.stage_misses if row is None else self.stage_hits
+                counters[stage] = counters.get(stage, 0) + 1
+            elif row is None:
+                self.misses += 1
+            else:
+                self.hits += 1
+        if row is None:
+            return None
+        return json.loads(row.value)
+
+    def set(self, key: str, content_hash: str, value: Any) -> None:
+        payload = json.dumps(value)
+        now = time.time()
+        with self.engine.begin() as conn:
+            conn.execute(delete(self.entries).where(self.entries.c.key == key))
+            conn.execute(insert(self.entries).values(
+                key=key, contentHash=content_hash, value=payload,
+                size=len(payload), createdAt=now, accessedAt=now))
+        self.evict()
+
+    def invalidate(self, content_hash: str) -> int:
+        """
+        Remove every cached result for an upload, whatever configuration produced it.
+        """
+        with self.engine.begin() as conn:
+            result = conn.execute(
+                delete(self.entries).where(self.entries.c.contentHash == content_hash))
+        return result.rowcount
+
+    def evict(self) -> None:
+        """
+        Apply age- and size-based eviction.
+        """
+        with self.engine.begin() as conn:
+            if self.max_age:
+                conn.execute(delete(self.entries).where(
+                    self.entries.c.createdAt < time.time() - self.max_age))
+            total = conn.execute(select(func.coalesce(func.sum(self.entries.c.size), 0))).scalar()
+            if total <= self.max_bytes:
+                return
+            rows = conn.execute(select(self.entries.c.key, self.entries.c.size)
+                                .order_by(self.entries.c.accessedAt)).all()
+            for row in rows:
+                if total <= self.max_bytes:
+                    break
+                conn.execute(delete(self.entries).where(self.entries.c.key == row.key))
+                total -= row.size
+
+    def stats(self) -> Dict[str, Any]:
+        with self.engine.connect() as conn:
+            entries, size = conn.execute(select(
+                func.count(), func.coalesce(func.sum(self.entries.c.size), 0))).one()
+        lookups = self.hits + self.misses
+        with self._lock:
+            stages = {
+                stage: {"hits": self.stage_hits.get(stage, 0), "misses": self.stage_misses.get(stage, 0)}
+                for stage in sorted(set(self.stage_hits) | set(self.stage_misses))
+            }
+        return {
+            "entries": entries,
+            "bytes": size,
+            "maxBytes": self.max_bytes,
+            "maxAgeSeconds": self.max_age,
+            "hits": self.hits,
+            "misses": self.misses,
+            "hitRate": self.hits / lookups if lookups else 0.0,
+            "stages": stages,
+        }
+
+
+def create_result_cache() -> Optional[ResultCache]:
+    """
+    Build the result cache from the environment, or None when `RESULT_CACHE` is off.
+    """
+    if os.getenv("RESULT_CACHE", "true").lower() != "true":
+        return None
+    return ResultCache(
+        url=os.getenv("RESULT_CACHE_URL", "sqlite:///result_cache.db"),
+        max_bytes=int(os.getenv("RESULT_CACHE_MAX_BYTES", str(1024 ** 3))),
+        max_age=float(os.getenv("RESULT_CACHE_MAX_AGE", str(7 * 24 * 3600))),
+    )
+
+
+result_cache = create_result_cache()
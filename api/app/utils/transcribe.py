@@ -1,24 +1,121 @@
-import whisper
+import os
 import numpy as np
+from typing import Any, Optional, Callable, List, Dict
+from utils.engines import get_engine
+from utils.long_form import (long_form_transcriber, SAMPLE_RATE, find_split_points,
+                             plan_windows, transcribe_window)
+from utils.aud_extractor import decode_audio
+from utils.vad import SpeechMap, vad_enabled, vad_stats
+from utils.metrics import span
+
+
+def as_mono(soundarray: np.ndarray) -> np.ndarray:
+    """Float32 mono view of a (samples,) or (samples, channels) array."""
+    audio = np.asarray(soundarray, dtype=np.float32)
+    if audio.ndim > 1:
+        # flattening (samples, channels) would interleave the channels in time
+        audio = audio.mean(axis=1, dtype=np.float32)
+    return audio
+
 
 class Transcribe:
-    def __init__(self):
-        self.model = whisper.load_model("base")
+    def __init__(self, model_name: Optional[str] = None,
+                 device: Optional[str] = None,
+                 precision: Optional[str] = None,
+                 engine: Optional[str] = None):
+        # shared engine, its model loaded once per process
+        self.engine = get_engine(engine, model_name, device, precision)
+        _, self.model_name, self.device, self.precision = self.engine.key
+        self.fp16 = self.precision == "fp16"
+
+    @property
+    def model(self):
+        return self.engine.model
         
     def extract_text_from_audio(self, soundarray: np.ndarray) -> str:
-        """Extract text from an audio numpy array."""
-        audio = whisper.pad_or_trim(soundarray.flatten())
-        mel = whisper.log_mel_spectrogram(audio).to(self.model.device)
-        options = whisper.DecodingOptions()
-        result = whisper.decode(self.model, mel, options)
-        return result.text
+        """Extract text from an audio numpy array of any length."""
+        return self.transcribe_buffer(soundarray)["text"]
+
+    def transcribe_buffer(self, soundarray: np.ndarray) -> Dict[str, Any]:
+        """
+        Transcribe an in-memory 16 kHz array of any length, e.g. from
+        `AudioExtractor.to_soundarray`, into timestamped segments.
+        """
+        # through the engine, so the call shows up in its timings on /workers
+        return self.engine.transcribe(as_mono(soundarray))
     
     def extract_text_from_video(self, video: str) -> str:
         """Extract text from a video file."""
-        result = self.model.transcribe(video)
+        result = self.transcribe_from_video(video)
         return result['text']
     
     def transcribe_from_video(self, video: str) -> dict[str, str | list]:
         """Transcribe from a video file. And extract the Segments"""
-        result = self.model.transcribe(video)
+        # decode once to 16 kHz mono so Whisper does not spawn its own ffmpeg
+        return self.transcribe_audio(decode_audio(video, SAMPLE_RATE))
+
+    def transcribe_audio(self, audio: np.ndarray,
+                         on_segments: Optional[Callable[[List[Dict]], None]] = None) -> dict[str, str | list]:
+        """Transcribe a 16 kHz mono float32 array and extract the Segments"""
+        if vad_enabled():
+            return self.transcribe_speech(audio, on_segments)
+        return self.transcribe_array(audio, on_segments)
+
+    def transcribe_speech(self, audio: np.ndarray,
+                          on_segments: Optional[Callable[[List[Dict]], None]] = None) -> dict[str, str | list]:
+        """Transcribe only the spans with speech, with timestamps on the original timeline."""
+        with span("vad"):
+            speech_map = SpeechMap.detect(audio)
+        vad_stats.record(speech_map)
+        stats = speech_map.stats()
+        print(f"VAD skipped {stats['skippedSeconds']:.1f}s of {stats['originalSeconds']:.1f}s of audio")
+        if not len(speech_map.audio):
+            return {"text": "", "segments": [], "vad": stats}
+
+        forward = None
+        if on_segments:
+            forward = lambda window_segments: on_segments(speech_map.remap_segments(window_segments))
+        result = self.transcribe_array(speech_map.audio, forward)
+        result["segments"] = speech_map.remap_segments(result["segments"])
+        result["vad"] = stats
         return result
+
+    def transcribe_array(self, audio: np.ndarray,
+                         on_segments: Optional[Callable[[List[Dict]], None]] = None) -> dict[str, str | list]:
+        """Transcribe an array as is, in long-form, streaming or single-call mode."""
+        # Audio at least this long is split into windows decoded in parallel (0 disables)
+        long_form_seconds = float(os.getenv("WHISPER_LONG_FORM_MIN_SECONDS", "0"))
+        with span("whisper"):
+            if long_form_seconds > 0 and len(audio) / SAMPLE_RATE >= long_form_seconds:
+                return self.transcribe_long_form(audio, on_segments)
+            if on_segments:
+                return self.transcribe_streaming(audio, on_segments)
+            return self.engine.transcribe(audio)
+
+    def transcribe_long_form(self, audio: np.ndarray,
+                             on_segments: Optional[Callable[[List[Dict]], None]] = None) -> dict[str, str | list]:
+        """Transcribe a 16 kHz mono array in overlapping windows across worker processes."""
+        return long_form_transcriber.transcribe(audio, self.engine.key, on_segments)
+
+    def transcribe_streaming(self, audio: np.ndarray,
+                             on_segments: Callable[[List[Dict]], None],
+                             window_seconds: Optional[float] = None) -> dict[str, str | list]:
+        """Transcribe in consecutive windows split at silences, handing each window's segments to `on_segments`."""
+        window_seconds = window_seconds or float(os.getenv("WHISPER_STREAM_WINDOW_SECONDS", "60"))
+        windows = plan_windows(find_split_points(audio, window_seconds), 0.0)
+        segments = []
+        for start, end, _, _ in windows:
+            # carry the tail of the previous window as context across the cut
+            prompt = "".join(segment["text"] for segment in segments[-3:]) or None
+            window_segments = transcribe_window(
+                self.engine, audio[int(start * SAMPLE_RATE):int(end * SAMPLE_RATE)],
+                start, prompt)
+            for segment in window_segments:
+                segment["id"] = len(segments)
+                segments.append(segment)
+            if window_segments:
+                on_segments(window_segments)
+        return {
+            "text": "".join(segment["text"] for segment in segments),
+            "segments": segments,
+        }
@@ -0,0 +1,86 @@
+import hashlib
+import os
+import tempfile
+from typing import Optional, Tuple
+
+from fastapi import UploadFile
+
+
+class UploadTooLargeError(Exception):
+    """Raised when an upload exceeds the configured maximum size."""
+
+
+async def stream_upload_to_disk(file: UploadFile,
+                                chunk_size: Optional[int] = None,
+                                max_bytes: Optional[int] = None) -> Tuple[str, str]:
+    """
+    Stream an upload to a unique temporary file in fixed-size chunks.
+
+    The size limit is enforced while streaming, so oversized uploads are
+    rejected without ever being held in memory. The SHA-256 of the content is
+    computed on the way through. Returns (temporary path, hex digest); the
+    caller is responsible for removing the file.
+    """
+    chunk_size = chunk_size or int(os.getenv("UPLOAD_CHUNK_SIZE", str(1024 * 1024)))
+    if max_bytes is None:
+        max_bytes = int(os.getenv("UPLOAD_MAX_BYTES", str(4 * 1024 ** 3)))
+
+    # Keep the extension so ffmpeg can sniff the container, but never the client's name
+    suffix = os.path.splitext(os.path.basename(file.filename or ""))[1]
+    fd, video_path = tempfile.mkstemp(prefix="upload-", suffix=suffix,
+                                      dir=os.getenv("UPLOAD_DIR") or None)
+    written = 0
+    digest = hashlib.sha256()
+    try:
+        with os.fdopen(fd, "wb") as buffer:
+            while True:
+                chunk = await file.read(chunk_size)
+                if not chunk:
+                    break
+                written += len(chunk)
+                if max_bytes and written > max_bytes:
+                    raise UploadTooLargeError(
+                        f"Upload exceeds the maximum size of {max_bytes} bytes")
+                digest.update(chunk)
+                buffer.write(chunk)
+    except BaseException:
+        os.remove(video_path)
+        raise
+    finally:
+        await file.close()
+
+    return video_path, digest.hexdigest()
+
+
+class LocalPathError(Exception):
+    """Raised when a server-side path may not be analyzed."""
+
+
+def resolve_local_path(path: str, root: Optional[str] = None) -> str:
+    """
+    Resolve a server-side video path, which must be a file under `root`
+    (`LOCAL_VIDEO_ROOT` by default). Local paths are refused when no root is set.
+    """
+    root = root or os.getenv("LOCAL_VIDEO_ROOT")
+    if not root:
+        raise LocalPathError("Local paths are disabled (LOCAL_VIDEO_ROOT is not set)")
+    root = os.path.realpath(root)
+    # resolve symlinks so a link inside the root cannot point outside it
+    resolved = os.path.realpath(os.path.join(root, path))
+    if os.path.commonpath([root, resolved]) != root:
+        raise LocalPathError(f"Path is outside the local video root: {path}")
+    if not os.path.isfile(resolved):
+        raise LocalPathError(f"No such file: {path}")
+    return resolved
+
+
+def hash_file(path: str, chunk_size: Optional[int] = None) -> str:
+    """
+    SHA-256 of a file on disk, read in fixed-size chunks.
+    """
+    chunk_size = chunk_size or int(os.getenv("UPLOAD_CHUNK_SIZE", str(1024 * 1024)))
+    digest = hashlib.sha256()
+    with open(path, "rb") as source:
+        for chunk in iter(lambda: source.read(chunk_size), b""):
+            digest.update(chunk)
+    return digest.hexdigest()
@@ -0,0 +1,159 @@
+import bisect
+import os
+import threading
+from typing import Any, Dict, List, Optional, Tuple
+
+import numpy as np
+
+from utils.long_form import SAMPLE_RATE, FRAME_SECONDS, frame_energy
+
+
+def vad_enabled() -> bool:
+    return os.getenv("WHISPER_VAD", "false").lower() == "true"
+
+
+def vad_config() -> Dict[str, float]:
+    """
+    VAD settings from the environment; part of the transcription fingerprint.
+    """
+    return {
+        "thresholdDb": float(os.getenv("VAD_THRESHOLD_DB", "35")),
+        "minSilence": float(os.getenv("VAD_MIN_SILENCE_SECONDS", "1.0")),
+        "padding": float(os.getenv("VAD_PADDING_SECONDS", "0.3")),
+    }
+
+
+def speech_spans(audio: np.ndarray, threshold_db: float = 35.0,
+                 min_silence: float = 1.0, padding: float = 0.3,
+                 sample_rate: int = SAMPLE_RATE) -> List[Tuple[float, float]]:
+    """
+    Spans of a mono signal that contain speech, as (start, end) in seconds.
+
+    A frame is speech when its RMS energy is within `threshold_db` of the loud
+    end of the recording (95th percentile), so the threshold adapts to the
+    recording level. Pauses shorter than `min_silence` are kept, and every span
+    is widened by `padding` so word onsets and tails are not clipped.
+    """
+    duration = len(audio) / sample_rate
+    energy = frame_energy(audio, sample_rate)
+    if not len(energy):
+        return [(0.0, duration)] if duration else []
+    reference = float(np.percentile(energy, 95))
+    if reference <= 0:
+        return []
+    voiced = energy > reference * 10 ** (-threshold_db / 20)
+
+    # rising and falling edges of the voiced mask, in frames
+    edges = np.flatnonzero(np.diff(np.concatenate(([0], voiced.astype(np.int8), [0]))))
+    spans = []
+    for start, end in zip(edges[::2], edges[1::2]):
+        start = max(0.0, float(start) * FRAME_SECONDS - padding)
+        end = min(duration, float(end) * FRAME_SECONDS + padding)
+        if spans and start - spans[-1][1] < min_silence:
+            spans[-1] = (spans[-1][0], end)
+        else:
+            spans.append((start, end))
+    return spans
+
+
+class SpeechMap:
+    """
+    Audio with the non-speech spans cut out, plus the mapping from the compacted
+    timeline back to the original one.
+    """
+
+    def __init__(self, audio: np.ndarray, spans: List[Tuple[float, float]],
+                 sample_rate: int = SAMPLE_RATE):
+        self.original_seconds = len(audio) / sample_rate
+        self.sample_rate = sample_rate
+        # (start on the compacted timeline, start on the original timeline)
+        self.offsets: List[Tuple[float, float]] = []
+        pieces = []
+        compact = 0.0
+        for start, end in spans:
+            piece = audio[int(start * sample_rate):int(end * sample_rate)]
+            if not len(piece):
+                continue
+            self.offsets.append((compact, start))
+            pieces.append(piece)
+            compact += len(piece) / sample_rate
+        self.audio = np.concatenate(pieces) if pieces else audio[:0]
+        self.speech_seconds = compact
+        self._starts = [compact_start for compact_start, _ in self.offsets]
+
+    @classmethod
+    def detect(cls, audio: np.ndarray, sample_rate: int = SAMPLE_RATE) -> "SpeechMap":
+        config = vad_config()
+        spans = speech_spans(audio, config["thresholdDb"], config["minSilence"],
+                             config["padding"], sample_rate)
+        return cls(audio, spans, sample_rate)
+
+    def to_original(self, seconds: float, end: bool = False) -> float:
+        """
+        Map a time on the compacted timeline to the original one. An end time
+        that falls exactly on a cut belongs to the span before the cut.
+        """
+        if not self.offsets:
+            return seconds
+        find = bisect.bisect_left if end else bisect.bisect_right
+        idx = max(0, find(self._starts, seconds) - 1)
+        compact_start, original_start = self.offsets[idx]
+        return original_start + seconds - compact_start
+
+    def remap_segments(self, segments: List[Dict[str, Any]]) -> List[Dict[str, Any]]:
+        """
+        Copies of Whisper segments with timestamps on the original timeline.
+        """
+        remapped = []
+        for segment in segments:
+            segment = dict(segment)
+            segment["start"] = self.to_original(segment["start"])
+            segment["end"] = self.to_original(segment["end"], end=True)
+            segment["seek"] = int(round(segment["start"] * 100))
+            if segment.get("words"):
+                segment["words"] = [dict(word, start=self.to_original(word["start"]),
+                                         end=self.to_original(word["end"], end=True))
+                                    for word in segment["words"]]
+            remapped.append(segment)
+        return remapped
+
+    def stats(self) -> Dict[str, float]:
+        skipped = self.original_seconds - self.speech_seconds
+        return {
+            "originalSeconds": self.original_seconds,
+            "speechSeconds": self.speech_seconds,
+            "skippedSeconds": skipped,
+            "skippedRatio": skipped / self.original_seconds if self.original_seconds else 0.0,
+        }
+
+
+class VadStats:
+    """
+    Running totals of audio skipped by the VAD pre-pass, exposed on `/workers`.
+    """
+
+    def __init__(self):
+        self._lock = threading.Lock()
+        self.files = 0
+        self.original_seconds = 0.0
+        self.skipped_seconds = 0.0
+
+    def record(self, speech_map: SpeechMap) -> None:
+        with self._lock:
+            self.files += 1
+            self.original_seconds += speech_map.original_seconds
+            self.skipped_seconds += speech_map.original_seconds - speech_map.speech_seconds
+
+    def stats(self) -> Dict[str, Any]:
+        with self._lock:
+            return {
+                "enabled": vad_enabled(),
+                "files": self.files,
+                "originalSeconds": self.original_seconds,
+                "skippedSeconds": self.skipped_seconds,
+                "skippedRatio": self.skipped_seconds / self.original_seconds
+                if self.original_seconds else 0.0,
+            }
+
+
+vad_stats = VadStats()
@@ -1,54 +1,377 @@
-from typing import List, Dict, Tuple
+from typing import List, Dict, Tuple, Optional, Callable
 import requests
 import datetime
 import json
+import hashlib
+from concurrent.futures import ThreadPoolExecutor
 from utils.transcribe import Transcribe
-import google.generativeai as genai
+from utils.aud_extractor import decode_audio
+from utils.long_form import SAMPLE_RATE
+from utils.engines import resolve_engine_key
+from utils.vad import vad_config, vad_enabled
+from utils.metrics import span, record_audio
+from utils.llm_client import LLMError, get_llm_client
+from utils.json_stream import ChapterStreamParser
+from utils.chapter_parser import parse_chapter_response, parse_stats, reask_prompt, validate_chapters
+from media_analyzer.alignment import ALIGNMENT_VERSION
 import os
 
 class VideoProcessor:
 
-    def transcribe_video(self, video: str) -> List[Dict]:
+    def __init__(self, model_name: Optional[str] = None,
+                 device: Optional[str] = None,
+                 precision: Optional[str] = None,
+                 engine: Optional[str] = None,
+                 streaming: bool = False):
+        # Transcription engine and model configuration, resolved from the environment when omitted
+        self.model_name = model_name
+        self.device = device
+        self.precision = precision
+        self.engine = engine
+        # segments are streamed to a client while decoding (see Transcribe.transcribe_streaming)
+        self.streaming = streaming
+
+    def transcription_fingerprint(self) -> str:
+        """
+        Hash of the Whisper configuration that determines the segments.
+        """
+        engine, model_name, _, precision = resolve_engine_key(
+            self.engine, self.model_name, self.device, self.precision)
+        config = {"whisper": [model_name, precision]}
+        if engine != "whisper":
+            config["engine"] = engine
+        elif int(os.getenv("WHISPER_BATCH_SIZE", "1")) > 1:
+            # batched windows are decoded without the previous text as prompt
+            config["decoding"] = "batched"
+        if self.streaming:
+            # prompted windows split at silences give different segments than a single call
+            config["streaming"] = os.getenv("WHISPER_STREAM_WINDOW_SECONDS", "60")
+        if float(os.getenv("WHISPER_LONG_FORM_MIN_SECONDS", "0")) > 0:
+            # windows stitched across worker processes give different segments too
+            config["longForm"] = [os.getenv("WHISPER_LONG_FORM_MIN_SECONDS"),
+                                  os.getenv("WHISPER_WINDOW_SECONDS", "300"),
+                                  os.getenv("WHISPER_WINDOW_OVERLAP", "5")]
+        if vad_enabled():
+            # skipped audio changes the segments
+            config["vad"] = vad_config()
+        return hashlib.sha256(json.dumps(config, sort_keys=True).encode()).hexdigest()
+
+    def chaptering_fingerprint(self) -> str:
+        """
+        Hash of the LLM model and prompt that determine the chapters.
+        """
+        config = {
+            "llm": get_llm_client().fingerprint(),
+            "systemInstruction": self.system_instruction(),
+            "segmentInstruction": self.segment_system_instruction(),
+            "chapterOutput": os.getenv("CHAPTER_OUTPUT", "content"),
+            "chapterMode": os.getenv("CHAPTER_MODE", "auto"),
+            "chapterWindow": [os.getenv("CHAPTER_WINDOW_CHARS", "100000"),
+                              os.getenv("CHAPTER_WINDOW_OVERLAP_LINES", "10")],
+        }
+        return hashlib.sha256(json.dumps(config, sort_keys=True).encode()).hexdigest()
+
+    def alignment_fingerprint(self) -> str:
+        """
+        Alignment mode and version that determine the aligned chapters.
+        Kept out of the chaptering fingerprint so switching modes does not rerun the LLM.
+        """
+        return f"{os.getenv('ALIGNMENT_MODE', 'greedy')}:{ALIGNMENT_VERSION}"
+
+    def fingerprint(self) -> str:
+        """
+        Hash of the model, prompt and alignment configuration that determines the output.
+        """
+        return hashlib.sha256(
+            f"{self.transcription_fingerprint()}:{self.chaptering_fingerprint()}:"
+            f"{self.alignment_fingerprint()}".encode()).hexdigest()
+
+    def transcribe_video(self, video: str,
+                         progress: Optional[Callable[[str, float], None]] = None,
+                         on_segments: Optional[Callable[[List[Dict]], None]] = None) -> List[Dict]:
         """
         Transcribe video using Google Gemini API and return segments with timestamps.
         """
-        txtExtractor: Transcribe = Transcribe()
+        report = progress or (lambda stage, fraction: None)
+        txtExtractor: Transcribe = Transcribe(
+            self.model_name, self.device, self.precision, self.engine)
+
+        # Single decode of the audio track, handed to Whisper as an array
+        report("extracting", 0.0)
+        with span("decode"):
+            audio = decode_audio(video, SAMPLE_RATE)
+        record_audio(len(audio) / SAMPLE_RATE)
+
+        report("transcribing", 0.05)
         transcription: dict[str, str |
-                            list] = txtExtractor.transcribe_from_video(video)
+                            list] = txtExtractor.transcribe_audio(audio, on_segments)
         return transcription["segments"]
 
-    def analyze_content(self, transcript) -> List[Dict]:
+    def analyze_content(self, transcript, system_instruction: Optional[str] = None,
+                        on_chapter: Optional[Callable[[Dict], None]] = None,
+                        required_field: str = "content") -> List[Dict]:
         """
-        Analyze content and create chapters using Google Gemini API.
+        Analyze content and create chapters using the configured LLM backend.
+        The response is parsed while it streams in; `on_chapter` receives each
+        chapter as soon as it is complete.
         """
+        parser = ChapterStreamParser()
+        try:
+            with span("llm"):
+                for chunk in get_llm_client().stream(
+                        transcript, system_instruction or self.system_instruction()):
+                    for chapter in parser.feed(chunk):
+                        if on_chapter:
+                            on_chapter(chapter)
+        except LLMError as e:
+            if not parser.chapters:
+                raise
+            print(f"Error: {e}; keeping {len(parser.chapters)} chapters parsed before the failure")
+            parse_stats.record("responses")
+            parse_stats.record("partial")
+            return validate_chapters(parser.partial_result(), required_field)[0]
 
-        gemini_api_key = os.getenv("GEMINI_API_KEY")
-        gemini_model = os.getenv("GEMINI_MODEL")
-        genai.configure(api_key=gemini_api_key)
-        model = genai.GenerativeModel(
-            model_name=gemini_model,
-            system_instruction=self.system_instruction(),
-        )
-        response = model.generate_content(transcript)
+        with span("parse"):
+            return self.parse_response(parser.text, required_field)
 
-        # Remove triple backticks and any leading/trailing whitespace
-        raw_content = response.text
-        raw_content = raw_content.strip()
-        if raw_content.startswith("```") and raw_content.endswith("```"):
-            raw_content = raw_content[3:-3].strip()
+    def parse_response(self, raw_content: str, required_field: str = "content") -> Optional[Dict]:
+        """
+        Parse and validate an LLM response, repairing it where possible and
+        asking the model to fix it when repair fails.
+        """
+        parse_stats.record("responses")
+        result, outcome, error = parse_chapter_response(raw_content, required_field)
+        if result is not None:
+            # partial: malformed trailing output, the complete chapters are kept
+            parse_stats.record(outcome)
+            return result
+
+        # a cheap follow-up with only the broken output, not the transcript
+        for _ in range(int(os.getenv("LLM_REASK_ATTEMPTS", "1"))):
+            parse_stats.record("reasked")
+            try:
+                fixed = get_llm_client().generate(reask_prompt(raw_content, error, required_field))
+            except LLMError as e:
+                print(f"Error: re-ask failed: {e}")
+                break
+            result, _, error = parse_chapter_response(fixed, required_field)
+            if result is not None:
+                parse_stats.record("reaskRecovered")
+                return result
+
+        parse_stats.record("failed")
+        print(f"Error: Could not parse the content as JSON ({error}).")
+        print("Raw Content:", raw_content)
+        return None
+
+    def chapter_transcript(self, transcript: str,
+                           on_chapter: Optional[Callable[[Dict], None]] = None) -> Dict:
+        """
+        Create chapters for a timestamped transcript, in one LLM call or map-reduce
+        over windows depending on `CHAPTER_MODE` (single, chunked or auto).
+        `on_chapter` only fires in single mode, where chapters are final as parsed.
+        """
+        window_chars = int(os.getenv("CHAPTER_WINDOW_CHARS", "100000"))
+        if self.use_windows(transcript, window_chars):
+            return self.analyze_content_chunked(transcript, window_chars)
+        return self.analyze_content(transcript, on_chapter=on_chapter)
 
-        # Handle case where content starts with "json\n"
-        if raw_content.startswith("json\n"):
-            raw_content = raw_content[5:]
+    def use_windows(self, transcript: str, window_chars: int) -> bool:
+        """
+        Whether `CHAPTER_MODE` (single, chunked or auto) calls for map-reduce over windows.
+        """
+        mode = os.getenv("CHAPTER_MODE", "auto")
+        if mode not in ("single", "auto", "chunked"):
+            raise ValueError(f"Unsupported chapter mode: {mode}")
+        return mode == "chunked" or (mode == "auto" and len(transcript) > window_chars)
+
+    def map_windows(self, transcript: str, window_chars: int,
+                    system_instruction: Optional[str] = None,
+                    required_field: str = "content") -> List[Tuple[Tuple[str, int, int], Dict]]:
+        """
+        Map step of chunked chaptering: chapter overlapping windows of the
+        transcript concurrently. Returns (window, result) for every window
+        that produced chapters, in transcript order.
+        """
+        overlap_lines = int(os.getenv("CHAPTER_WINDOW_OVERLAP_LINES", "10"))
+        concurrency = int(os.getenv("CHAPTER_CONCURRENCY", "4"))
+        windows = self.split_transcript(transcript, window_chars, overlap_lines)
+        with ThreadPoolExecutor(max_workers=max(1, concurrency)) as executor:
+            results = list(executor.map(
+                lambda window: self.analyze_content(window[0], system_instruction,
+                                                    required_field=required_field),
+                windows))
+        return [(window, result) for window, result in zip(windows, results)
+                if result and result.get("chapters")]
+
+    def main_topics(self, results: List[Dict]) -> List[str]:
+        """
+        The distinct main topics of several chapter results, in first-seen order.
+        """
+        topics = []
+        for result in results:
+            for topic in result.get("metadata", {}).get("mainTopics", []):
+                if topic not in topics:
+                    topics.append(topic)
+        return topics
+
+    def chapter_segments(self, segments: List[Dict]) -> Optional[Dict]:
+        """
+        Create chapters by asking the LLM only for a title and start segment id per
+        chapter, then rebuild content and timestamps from the Whisper segments.
+        """
+        transcript = self.compact_transcript(segments)
+        instruction = self.segment_system_instruction()
+        window_chars = int(os.getenv("CHAPTER_WINDOW_CHARS", "100000"))
+
+        if self.use_windows(transcript, window_chars):
+            mapped = self.map_windows(transcript, window_chars, instruction, "startSegment")
+        else:
+            result = self.analyze_content(transcript, instruction, required_field="startSegment")
+            mapped = [((transcript, 0, len(segments)), result)] if result and result.get("chapters") else []
+
+        # one transcript line per segment, so line numbers are segment ids
+        starts = []
+        for (_, own_start, own_end), result in mapped:
+            for chapter in result["chapters"]:
+                try:
+                    segment_id = int(chapter.get("startSegment"))
+                except (TypeError, ValueError):
+                    continue
+                if own_start <= segment_id < own_end:
+                    starts.append((segment_id, chapter.get("title", "")))
+
+        if not starts:
+            return None
+        return self.chapters_from_starts(starts, segments, self.main_topics([result for _, result in mapped]))
+
+    def chapters_from_starts(self, starts: List[Tuple[int, str]], segments: List[Dict],
+                             topics: Optional[List[str]] = None) -> Dict:
+        """
+        Build the usual chapters payload from (start segment id, title) pairs.
+        Each chapter runs until the segment before the next chapter's start.
+        """
+        unique = {}
+        for segment_id, title in sorted(starts, key=lambda start: start[0]):
+            unique.setdefault(segment_id, title)
+        ordered = sorted(unique.items())
+        # anything before the first reported start belongs to the first chapter
+        ordered[0] = (0, ordered[0][1])
+
+        chapters = []
+        for number, (start_idx, title) in enumerate(ordered, start=1):
+            end_idx = ordered[number][0] - 1 if number < len(ordered) else len(segments) - 1
+            chapters.append({
+                "chapterNumber": number,
+                "title": title,
+                "content": "".join(segment["text"] for segment in segments[start_idx:end_idx + 1]).strip(),
+                "startTime": self.format_timestamp(segments[start_idx]["start"]),
+                "endTime": self.format_timestamp(segments[end_idx]["end"]),
+                "startSegment": start_idx,
+                "endSegment": end_idx,
+            })
+        return {
+            "chapters": chapters,
+            "metadata": {
+                "totalChapters": len(chapters),
+                "mainTopics": topics or [],
+            }
+        }
+
+    def compact_transcript(self, segments: List[Dict]) -> str:
+        """
+        Transcript with a short segment id instead of a timestamp on each line.
+        """
+        return "\n".join(f"[{idx}] {segment['text'].strip()}" for idx, segment in enumerate(segments))
 
-        # Parse the cleaned JSON string
+    def split_transcript(self, transcript: str, window_chars: int,
+                         overlap_lines: int) -> List[Tuple[str, int, int]]:
+        """
+        Split a timestamped transcript into windows of at most `window_chars`
+        characters, each extended by `overlap_lines` lines of context on both sides.
+        Returns (window text, first owned line, end owned line) per window.
+        """
+        lines = transcript.split("\n")
+        windows = []
+        start = 0
+        while start < len(lines):
+            end = start
+            size = 0
+            while end < len(lines) and (end == start or size + len(lines[end]) + 1 <= window_chars):
+                size += len(lines[end]) + 1
+                end += 1
+            context_start = max(0, start - overlap_lines)
+            context_end = min(len(lines), end + overlap_lines)
+            windows.append(("\n".join(lines[context_start:context_end]), start, end))
+            start = end
+        return windows
+
+    def analyze_content_chunked(self, transcript: str, window_chars: Optional[int] = None) -> Optional[Dict]:
+        """
+        Map-reduce chaptering for transcripts that do not fit one LLM call:
+        chapter overlapping windows concurrently, then merge across window boundaries.
+        """
+        window_chars = window_chars or int(os.getenv("CHAPTER_WINDOW_CHARS", "100000"))
+        lines = transcript.split("\n")
+        mapped = self.map_windows(transcript, window_chars)
+
+        # Reduce: keep each chapter only in the window that owns its start time
+        chapters = []
+        for (_, own_start, own_end), result in mapped:
+            own_from = self.line_seconds(lines[own_start]) if own_start > 0 else 0.0
+            own_to = self.line_seconds(lines[own_end]) if own_end < len(lines) else float("inf")
+            for chapter in result["chapters"]:
+                start = self.parse_timestamp(chapter.get("startTime"))
+                if start is None:
+                    start = own_from
+                if own_from <= start < own_to:
+                    chapters.append(dict(chapter, startTime=self.format_timestamp(start)))
+
+        if not chapters:
+            return None
+
+        merged = []
+        for chapter in sorted(chapters, key=lambda c: self.parse_timestamp(c["startTime"])):
+            # the same topic split by a window boundary comes back as two chapters
+            if merged and merged[-1]["title"].strip().lower() == chapter["title"].strip().lower():
+                merged[-1]["content"] = f"{merged[-1]['content']} {chapter.get('content', '')}".strip()
+                merged[-1]["endTime"] = chapter.get("endTime", merged[-1].get("endTime"))
+                continue
+            merged.append(dict(chapter))
+
+        for number, chapter in enumerate(merged, start=1):
+            chapter["chapterNumber"] = number
+            if number < len(merged):
+                chapter["endTime"] = merged[number]["startTime"]
+
+        return {
+            "chapters": merged,
+            "metadata": {
+                "totalChapters": len(merged),
+                "mainTopics": self.main_topics([result for _, result in mapped]),
+            }
+        }
+
+    def parse_timestamp(self, value) -> Optional[float]:
+        """
+        Convert an HH:MM:SS or MM:SS timestamp to seconds, or None if it cannot be parsed.
+        """
+        if value is None:
+            return None
         try:
-            json_object = json.loads(raw_content)
-            return json_object
-        except json.JSONDecodeError as e:
-            print("Error: Could not parse the content as JSON.")
-            print("Raw Content:", raw_content)
+            parts = [float(part) for part in str(value).strip().split(":")]
+        except ValueError:
             return None
+        seconds = 0.0
+        for part in parts:
+            seconds = seconds * 60 + part
+        return seconds
+
+    def line_seconds(self, line: str) -> float:
+        """
+        Start time of a "[H:MM:SS] text" transcript line.
+        """
+        return self.parse_timestamp(line[1:line.index("]")]) or 0.0
 
     def format_timestamp(self, seconds: float) -> str:
         """
@@ -102,3 +425,36 @@ class VideoProcessor:
         """
 
         return prompt
+
+    def segment_system_instruction(self) -> str:
+        prompt = f"""
+        You are a video transcription analyzer. Your task is to break down the following video transcription into structured chapters.
+
+        Each line of the transcription starts with a segment id in square brackets, for example "[12] text".
+
+        Go through the transcription and IDENTIFY KEY TOPICS or CHANGES in SUBJECT MATTER. Split the transcription into chapters based on these topics.
+
+        Rules for processing:
+        1. For each chapter return ONLY a title and the id of the segment where the chapter starts
+        2. Do NOT repeat any text from the transcription
+        3. Split chapters based on clear topic changes or natural pauses
+        4. **You MUST respond with a valid JSON output only. Do NOT output any other text or explanations.**
+
+        Required JSON structure:
+        {{
+        "chapters": [
+            {{
+            "title": [brief descriptive title, max 8 words],
+            "startSegment": [segment id]
+            }}
+        ],
+        "metadata": {{
+            "mainTopics": [array of key topics covered]
+        }}
+        }}
+
+        **Your Response MUST be in JSON format.**
+
+        """
+
+        return prompt
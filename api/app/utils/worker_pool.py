@@ -0,0 +1,173 @@
+import asyncio
+import multiprocessing
+import os
+import time
+from concurrent.futures import Executor, ProcessPoolExecutor, ThreadPoolExecutor
+from typing import Any, Callable, Dict, Optional, Tuple
+
+from utils.metrics import StageMetrics, collecting, stage_metrics
+
+
+class QueueFullError(Exception):
+    """Raised when the worker pool cannot accept more work."""
+
+
+def _timed_call(fn: Callable, args: tuple, kwargs: dict) -> Tuple[float, float, Any]:
+    # Module level so it can be pickled for process pools
+    started_at = time.time()
+    result = fn(*args, **kwargs)
+    return started_at, time.time(), result
+
+
+def _init_process_worker() -> None:
+    # Runs once in each worker process: load the models there before the first
+    # job, as the parent's warm-up does not reach the workers
+    if os.getenv("WHISPER_WARMUP", "true").lower() == "true":
+        from utils.engines import warm_up_engines
+        warm_up_engines()
+
+
+def _metered_call(fn: Callable, args: tuple, kwargs: dict) -> Tuple[Tuple[float, float, Any], Dict[str, Any]]:
+    # Runs in a worker process: hand back the stage metrics recorded there,
+    # which the parent's /metrics would otherwise never see
+    collector = StageMetrics()
+    with collecting(collector):
+        timed = _timed_call(fn, args, kwargs)
+    return timed, collector.export()
+
+
+class WorkerPool:
+    """
+    Bounded pool that runs blocking analysis work off the event loop.
+
+    At most `max_workers` jobs run at once and at most `max_queue` more wait for a
+    worker; anything beyond that is rejected with `QueueFullError`.
+    """
+
+    def __init__(self, max_workers: Optional[int] = None,
+                 max_queue: Optional[int] = None,
+                 kind: Optional[str] = None):
+        self.max_workers = max_workers or int(
+            os.getenv("ANALYZER_WORKERS", str(max(1, (os.cpu_count() or 2) // 2))))
+        self.max_queue = max_queue if max_queue is not None else int(
+            os.getenv("ANALYZER_MAX_QUEUE", "8"))
+        self.kind = kind or os.getenv("ANALYZER_POOL", "thread")
+        if self.kind not in ("thread", "process"):
+            raise ValueError(f"Unsupported worker pool kind: {self.kind}")
+
+        self._executor: Optional[Executor] = None
+        self._local_executor: Optional[ThreadPoolExecutor] = None
+        self._pending = 0
+        self._started_at = time.time()
+        self._completed = 0
+        self._failed = 0
+        self._rejected = 0
+        self._total_wait = 0.0
+        self._max_wait = 0.0
+        self._busy_seconds = 0.0
+
+    def _get_executor(self) -> Executor:
+        if self._executor is None:
+            if self.kind == "process":
+                # spawn: forking a process that already holds torch state is unsafe
+                self._executor = ProcessPoolExecutor(
+                    max_workers=self.max_workers,
+                    mp_context=multiprocessing.get_context("spawn"),
+                    initializer=_init_process_worker)
+            else:
+                self._executor = ThreadPoolExecutor(
+                    max_workers=self.max_workers, thread_name_prefix="analyzer")
+            self._started_at = time.time()
+        return self._executor
+
+    def _get_local_executor(self) -> Executor:
+        if self.kind == "thread":
+            return self._get_executor()
+        if self._local_executor is None:
+            self._local_executor = ThreadPoolExecutor(
+                max_workers=self.max_workers, thread_name_prefix="analyzer-local")
+        return self._local_executor
+
+    @property
+    def capacity(self) -> int:
+        return self.max_workers + self.max_queue
+
+    def is_full(self) -> bool:
+        return self._pending >= self.capacity
+
+    async def run(self, fn: Callable, *args, **kwargs) -> Any:
+        """
+        Run `fn(*args, **kwargs)` on a worker and await its result.
+        """
+        if self.kind == "process":
+            return await self._run(self._get_executor, fn, args, kwargs, _metered_call)
+        return await self._run(self._get_executor, fn, args, kwargs)
+
+    async def run_local(self, fn: Callable, *args, **kwargs) -> Any:
+        """
+        Like `run`, but always on a thread in this process so `fn` may take
+        unpicklable arguments such as callbacks into the event loop.
+        Shares the same admission limits as `run`.
+        """
+        return await self._run(self._get_local_executor, fn, args, kwargs)
+
+    async def _run(self, get_executor: Callable[[], Executor], fn: Callable,
+                   args: tuple, kwargs: dict, call: Callable = _timed_call) -> Any:
+        if self.is_full():
+            self._rejected += 1
+            raise QueueFullError(
+                f"Analyzer queue is full ({self._pending}/{self.capacity} jobs)")
+
+        loop = asyncio.get_running_loop()
+        submitted_at = time.time()
+        self._pending += 1
+        try:
+            outcome = await loop.run_in_executor(get_executor(), call, fn, args, kwargs)
+            if call is _metered_call:
+                outcome, exported = outcome
+                stage_metrics.merge(exported)
+            started_at, finished_at, result = outcome
+        except Exception:
+            self._failed += 1
+            raise
+        finally:
+            self._pending -= 1
+
+        wait = max(0.0, started_at - submitted_at)
+        self._completed += 1
+        self._total_wait += wait
+        self._max_wait = max(self._max_wait, wait)
+        self._busy_seconds += finished_at - started_at
+        return result
+
+    def stats(self) -> Dict[str, Any]:
+        """
+        Snapshot of queue depth, wait times and worker utilisation.
+        """
+        uptime = max(time.time() - self._started_at, 1e-9)
+        active = min(self._pending, self.max_workers)
+        return {
+            "kind": self.kind,
+            "maxWorkers": self.max_workers,
+            "maxQueue": self.max_queue,
+            "cpuCount": os.cpu_count(),
+            "activeWorkers": active,
+            "queueDepth": max(0, self._pending - self.max_workers),
+            "completed": self._completed,
+            "failed": self._failed,
+            "rejected": self._rejected,
+            "avgWaitSeconds": self._total_wait / self._completed if self._completed else 0.0,
+            "maxWaitSeconds": self._max_wait,
+            "currentUtilisation": active / self.max_workers,
+            "avgUtilisation": min(1.0, self._busy_seconds / (uptime * self.max_workers)),
+        }
+
+    def shutdown(self, wait: bool = True) -> None:
+        for executor in (self._executor, self._local_executor):
+            if executor is not None:
+                executor.shutdown(wait=wait, cancel_futures=True)
+        self._executor = None
+        self._local_executor = None
+
+
+worker_pool = WorkerPool()
@@ -1,8 +1,13 @@
+import argparse
 from moviepy import *
 
+parser = argparse.ArgumentParser(description="Extract the audio track of a video file.")
 # Define the input video file and output audio file
-mp4_file = "vid1.mp4"
-mp3_file = "audio.mp3"
+parser.add_argument("video", nargs="?", default="vid1.mp4")
+parser.add_argument("audio", nargs="?", default="audio.mp3")
+args = parser.parse_args()
+mp4_file = args.video
+mp3_file = args.audio
 
 # Load the video clip
 video_clip = VideoFileClip(mp4_file)
@@ -17,4 +22,4 @@ audio_clip.write_audiofile(mp3_file)
 audio_clip.close()
 video_clip.close()
 
-print("Audio extraction successful!")
\ No newline at end of file
+print("Audio extraction successful!")
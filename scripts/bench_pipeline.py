@@ -0,0 +1,235 @@
+import argparse
+import json
+import math
+import os
+import platform
+import statistics
+import subprocess
+import sys
+import tempfile
+import time
+import wave
+from typing import Any, Callable, Dict, List, Optional
+
+from bench_text_matcher import make_transcript
+
+APP_DIR = os.path.join(os.path.dirname(os.path.abspath(__file__)), "..", "api", "app")
+
+
+def configure(args: argparse.Namespace) -> None:
+    # Must run before the app modules are imported: the result cache is created at import
+    os.environ["RESULT_CACHE"] = "true" if args.cache else "false"
+    os.environ["LLM_BACKEND"] = "stub"
+    os.environ["WHISPER_MODEL"] = args.whisper_model
+    os.environ.setdefault("WHISPER_DEVICE", "cpu")
+    sys.path.insert(0, os.path.abspath(APP_DIR))
+
+
+def timed(fn: Callable[[], Any], repeat: int) -> Dict[str, float]:
+    """Best and median wall-clock seconds over `repeat` runs."""
+    runs = []
+    for _ in range(repeat):
+        started = time.perf_counter()
+        fn()
+        runs.append(time.perf_counter() - started)
+    return {"seconds": min(runs), "median": statistics.median(runs), "repeat": repeat}
+
+
+def make_llm_output(chapters: List[Dict[str, Any]], broken: bool = False) -> str:
+    """A chapters response as an LLM returns it; `broken` adds the defects the parser repairs."""
+    payload = {"chapters": chapters,
+               "metadata": {"totalChapters": len(chapters), "mainTopics": ["synthetic"]}}
+    text = json.dumps(payload, indent=2)
+    if broken:
+        # code fence, trailing commas and a Python literal
+        text = text.replace("\n    }", ",\n    }").replace('"synthetic"', '"synthetic", None')
+        text = f"Here are the chapters:\n```json\n{text}\n```"
+    return text
+
+
+def write_synthetic_audio(path: str, seconds: float, sample_rate: int = 16000) -> None:
+    """
+    Mono 16-bit WAV alternating voiced-like bursts (amplitude-modulated
+    harmonics) with silent gaps, so silence detection has something to skip.
+    """
+    frames = bytearray()
+    total = int(seconds * sample_rate)
+    for n in range(total):
+        t = n / sample_rate
+        # 4 s of "speech", then 1 s of silence
+        voiced = (t % 5.0) < 4.0
+        value = 0.0
+        if voiced:
+            envelope = 0.5 + 0.5 * math.sin(2 * math.pi * 4 * t)
+            value = envelope * sum(math.sin(2 * math.pi * 140 * k * t) / k for k in range(1, 5)) * 0.2
+        frames += int(max(-1.0, min(1.0, value)) * 32767).to_bytes(2, "little", signed=True)
+    with wave.open(path, "wb") as out:
+        out.setnchannels(1)
+        out.setsampwidth(2)
+        out.setframerate(sample_rate)
+        out.writeframes(bytes(frames))
+
+
+class Suite:
+    def __init__(self, repeat: int):
+        self.repeat = repeat
+        self.results: List[Dict[str, Any]] = []
+
+    def run(self, name: str, size: Any, fn: Callable[[], Any], repeat: Optional[int] = None,
+            **extra) -> None:
+        try:
+            result = dict(timed(fn, repeat or self.repeat), benchmark=name, size=size, **extra)
+            print(f"{name:>32} {size:>8} {result['seconds']:>10.4f}")
+        except Exception as e:
+            result = {"benchmark": name, "size": size, "skipped": f"{type(e).__name__}: {e}"}
+            print(f"{name:>32} {size:>8} {'skipped':>10} ({result['skipped']})")
+        self.results.append(result)
+
+    def skip(self, name: str, error: Exception) -> None:
+        # missing app dependencies only skip the benchmarks that need them
+        print(f"{name:>32} {'-':>8} {'skipped':>10} ({type(error).__name__}: {error})")
+        self.results.append({"benchmark": name, "size": "-", "skipped": f"{type(error).__name__}: {error}"})
+
+
+def bench_text(suite: Suite, sizes: List[int], skip_difflib_above: int) -> None:
+    from text_matcher import align_chapters_with_whisper as script_align
+
+    try:
+        from media_analyzer.media_analyzer import find_chapter_segments, align_chapters, AlignmentIndex
+        from utils.video_processor import VideoProcessor
+    except ImportError as e:
+        suite.skip("media_analyzer", e)
+        VideoProcessor = None
+
+    for size in sizes:
+        n_chapters = max(4, size // 100)
+        segments, chapters = make_transcript(size, n_chapters)
+
+        for backend in ("difflib", "shingle"):
+            if backend == "difflib" and size > skip_difflib_above:
+                continue
+            suite.run(f"text_matcher.align[{backend}]", size,
+                      lambda: script_align(chapters, segments, backend), chapters=n_chapters)
+
+        if VideoProcessor is None:
+            continue
+        # one lookup that tokenizes every segment, as the legacy API does
+        suite.run("find_chapter_segments", size,
+                  lambda: find_chapter_segments(chapters[-1]["content"], segments))
+        index = AlignmentIndex(segments)
+        suite.run("find_chapter_segments[indexed]", size,
+                  lambda: [find_chapter_segments(chapter["content"], segments, index=index)
+                           for chapter in chapters], chapters=n_chapters)
+        for mode in ("greedy", "global"):
+            suite.run(f"align_chapters[{mode}]", size,
+                      lambda: align_chapters(chapters, segments, mode), chapters=n_chapters)
+        suite.run("create_timestamped_transcript", size,
+                  lambda: VideoProcessor().create_timestamped_transcript(segments))
+
+
+def bench_parsing(suite: Suite, sizes: List[int]) -> None:
+    try:
+        from utils.chapter_parser import parse_chapter_response
+        from utils.json_stream import ChapterStreamParser
+    except ImportError as e:
+        suite.skip("chapter_parser", e)
+        return
+
+    for size in sizes:
+        _, chapters = make_transcript(size, max(4, size // 100))
+        clean = make_llm_output(chapters)
+        broken = make_llm_output(chapters, broken=True)
+        suite.run("parse_chapter_response[clean]", size,
+                  lambda: parse_chapter_response(clean), bytes=len(clean))
+        suite.run("parse_chapter_response[repair]", size,
+                  lambda: parse_chapter_response(broken), bytes=len(broken))
+
+        def stream():
+            parser = ChapterStreamParser()
+            for idx in range(0, len(clean), 64):
+                parser.feed(clean[idx:idx + 64])
+
+        suite.run("ChapterStreamParser[64B chunks]", size, stream, bytes=len(clean))
+
+
+def bench_end_to_end(suite: Suite, audio_seconds: List[float]) -> None:
+    try:
+        from media_analyzer.media_analyzer import analyze_video
+    except ImportError as e:
+        suite.skip("analyze_video", e)
+        return
+
+    for seconds in audio_seconds:
+        fd, path = tempfile.mkstemp(suffix=".wav")
+        os.close(fd)
+        try:
+            write_synthetic_audio(path, seconds)
+            # the first call loads the model, so it is timed separately
+            suite.run("analyze_video[first]", seconds, lambda: analyze_video(path), repeat=1)
+            suite.run("analyze_video", seconds, lambda: analyze_video(path),
+                      model=os.environ["WHISPER_MODEL"])
+        finally:
+            os.remove(path)
+
+
+def git_commit() -> Optional[str]:
+    try:
+        return subprocess.run(["git", "rev-parse", "HEAD"], capture_output=True, text=True,
+                              check=True, cwd=os.path.dirname(os.path.abspath(__file__))).stdout.strip()
+    except (OSError, subprocess.CalledProcessError):
+        return None
+
+
+def compare(results: List[Dict[str, Any]], baseline_path: str) -> None:
+    with open(baseline_path) as file:
+        baseline = {(r["benchmark"], str(r["size"])): r for r in json.load(file)["results"]}
+    print(f"\n{'benchmark':>32} {'size':>8} {'before':>10} {'after':>10} {'ratio':>7}")
+    for result in results:
+        before = baseline.get((result["benchmark"], str(result["size"])))
+        if not before or "seconds" not in before or "seconds" not in result:
+            continue
+        ratio = result["seconds"] / before["seconds"] if before["seconds"] else float("inf")
+        print(f"{result['benchmark']:>32} {result['size']:>8} {before['seconds']:>10.4f} "
+              f"{result['seconds']:>10.4f} {ratio:>6.2f}x")
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Benchmark the chaptering pipeline on synthetic data.")
+    parser.add_argument("--sizes", type=int, nargs="+", default=[100, 1000, 5000, 20000],
+                        help="transcript sizes in segments")
+    parser.add_argument("--audio-seconds", type=float, nargs="+", default=[30, 120],
+                        help="synthetic audio lengths for the end-to-end run")
+    parser.add_argument("--repeat", type=int, default=3)
+    parser.add_argument("--skip-difflib-above", type=int, default=400,
+                        help="difflib is cubic; skip it for larger transcripts")
+    parser.add_argument("--whisper-model", default="tiny")
+    parser.add_argument("--cache", action="store_true", help="keep the result cache enabled")
+    parser.add_argument("--skip-end-to-end", action="store_true")
+    parser.add_argument("--output", default="bench_pipeline.json", help="where to save the results")
+    parser.add_argument("--compare", help="earlier results file to compare against")
+    args = parser.parse_args()
+    configure(args)
+
+    suite = Suite(args.repeat)
+    print(f"{'benchmark':>32} {'size':>8} {'seconds':>10}")
+    bench_text(suite, args.sizes, args.skip_difflib_above)
+    bench_parsing(suite, args.sizes)
+    if not args.skip_end_to_end:
+        bench_end_to_end(suite, args.audio_seconds)
+
+    report = {
+        "meta": {
+            "commit": git_commit(),
+            "createdAt": time.time(),
+            "python": platform.python_version(),
+            "platform": platform.platform(),
+            "cpuCount": os.cpu_count(),
+            "whisperModel": args.whisper_model,
+        },
+        "results": suite.results,
+    }
+    with open(args.output, "w") as file:
+        json.dump(report, file, indent=2)
+    print(f"\nSaved {len(suite.results)} results to {args.output}")
+    if args.compare:
+        compare(suite.results, args.compare)
@@ -0,0 +1,64 @@
+import argparse
+import random
+import time
+from typing import Any, Dict, List, Tuple
+
+from text_matcher import align_chapters_with_whisper
+
+WORDS = ("time series database stream data query amazon managed scalable serverless "
+         "memory storage analytics function pattern encryption transit rest application "
+         "architecture lambda kinesis prometheus flink dashboard machine learning connection "
+         "compatible lecture exam details records measures historical real cost tier").split()
+
+
+def make_transcript(n_segments: int, n_chapters: int, seed: int = 0) -> Tuple[List[Dict[str, Any]], List[Dict[str, Any]]]:
+    """Build synthetic Whisper segments and chapters whose content quotes consecutive segments."""
+    rng = random.Random(seed)
+    segments = []
+    t = 0.0
+    for i in range(n_segments):
+        text = " " + " ".join(rng.choice(WORDS) for _ in range(rng.randint(8, 16)))
+        duration = rng.uniform(2.0, 7.0)
+        segments.append({"id": i, "start": t, "end": t + duration, "text": text})
+        t += duration
+
+    per_chapter = max(1, n_segments // n_chapters)
+    chapters = []
+    for c in range(n_chapters):
+        chunk = segments[c * per_chapter:(c + 1) * per_chapter]
+        chapters.append({
+            "chapterNumber": c + 1,
+            "title": f"Chapter {c + 1}",
+            "content": "".join(segment["text"] for segment in chunk).strip(),
+        })
+    return segments, chapters
+
+
+def bench(backend: str, segments, chapters, repeat: int) -> Tuple[float, int]:
+    best = float("inf")
+    matched = 0
+    for _ in range(repeat):
+        started = time.perf_counter()
+        result = align_chapters_with_whisper(chapters, segments, backend)
+        best = min(best, time.perf_counter() - started)
+        matched = sum(1 for chapter in result if chapter["start"] is not None)
+    return best, matched
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Compare the difflib and shingle chapter aligners.")
+    parser.add_argument("--sizes", type=int, nargs="+", default=[50, 100, 200, 400])
+    parser.add_argument("--chapters", type=int, default=8)
+    parser.add_argument("--repeat", type=int, default=3)
+    parser.add_argument("--skip-difflib-above", type=int, default=400,
+                        help="difflib is cubic; skip it for larger transcripts")
+    args = parser.parse_args()
+
+    print(f"{'segments':>8} {'backend':>8} {'seconds':>10} {'matched':>8}")
+    for size in args.sizes:
+        segments, chapters = make_transcript(size, args.chapters)
+        for backend in ("difflib", "shingle"):
+            if backend == "difflib" and size > args.skip_difflib_above:
+                continue
+            seconds, matched = bench(backend, segments, chapters, args.repeat)
+            print(f"{size:>8} {backend:>8} {seconds:>10.4f} {matched:>5}/{len(chapters)}")
@@ -1,5 +1,8 @@
+import re
+from bisect import bisect_left
+from collections import Counter, defaultdict
 from difflib import SequenceMatcher
-from typing import List, Dict, Any
+from typing import List, Dict, Any, Optional, Tuple
 
 def similar(a: str, b: str) -> float:
     """Calculate similarity ratio between two strings."""
@@ -41,35 +44,115 @@ def find_segment_indices(chapter_content: str, segments: List[Dict[str, Any]]) -
     
     return best_start_idx, best_end_idx
 
+def tokenize(text: str) -> List[str]:
+    """Normalize text into lowercase word tokens, dropping punctuation."""
+    return re.findall(r"[a-z0-9']+", text.lower())
+
+class ShingleIndex:
+    """
+    Normalized token stream of all segments with an index of every n-gram (shingle) position.
+    Built once per transcript; chapters are then located by shingle lookups instead of
+    comparing strings against every segment.
+    """
+
+    def __init__(self, segments: List[Dict[str, Any]], n: int = 3):
+        self.n = n
+        self.tokens: List[str] = []
+        self.token_segment: List[int] = []  # token position -> segment index
+        self.segment_first_token: List[int] = []
+        for i, segment in enumerate(segments):
+            self.segment_first_token.append(len(self.tokens))
+            segment_tokens = tokenize(segment['text'])
+            self.tokens.extend(segment_tokens)
+            self.token_segment.extend([i] * len(segment_tokens))
+        self.segment_first_token.append(len(self.tokens))
+
+        self.positions: Dict[Tuple[str, ...], List[int]] = defaultdict(list)
+        for pos in range(len(self.tokens) - n + 1):
+            self.positions[tuple(self.tokens[pos:pos + n])].append(pos)
+
+    def _vote(self, shingles: List[Tuple[int, Tuple[str, ...]]], min_pos: int) -> Optional[int]:
+        """
+        Each (offset, shingle) pair votes for anchor = position - offset.
+        Returns the anchor with the most votes (earliest on ties) at or after min_pos.
+        """
+        votes = Counter()
+        for offset, shingle in shingles:
+            positions = self.positions.get(shingle, [])
+            for pos in positions[bisect_left(positions, min_pos):]:
+                votes[pos - offset] += 1
+        if not votes:
+            return None
+        best = max(votes.values())
+        return min(anchor for anchor, count in votes.items() if count == best)
+
+    def find_span(self, chapter_content: str, min_token: int = 0,
+                  probe: int = 8) -> Tuple[Optional[int], Optional[int], Optional[int]]:
+        """
+        Locate a chapter at or after token `min_token` from its first and last `probe` shingles.
+        Returns (start_segment, end_segment, end_token) or (None, None, None).
+        """
+        chapter_tokens = tokenize(chapter_content)
+        length = len(chapter_tokens)
+        n = self.n
+        if length < n or not self.tokens:
+            return None, None, None
+
+        shingles = [(i, tuple(chapter_tokens[i:i + n])) for i in range(length - n + 1)]
+        start_tok = self._vote(shingles[:probe], min_token)
+        if start_tok is None:
+            return None, None, None
+        start_tok = max(start_tok, min_token)
+
+        # offsets relative to the chapter's last token, so the vote lands on the end position
+        tail = [(i - (length - 1), shingle) for i, shingle in shingles[-probe:]]
+        end_tok = self._vote(tail, start_tok)
+        if end_tok is None:
+            end_tok = start_tok + length - 1
+
+        last = len(self.tokens) - 1
+        start_tok = min(start_tok, last)
+        end_tok = min(max(end_tok, start_tok), last)
+        return self.token_segment[start_tok], self.token_segment[end_tok], end_tok
+
 def align_chapters_with_whisper(gemma_chapters: List[Dict[str, Any]], 
-                              whisper_segments: List[Dict[str, Any]]) -> List[Dict[str, Any]]:
+                              whisper_segments: List[Dict[str, Any]],
+                              backend: str = "shingle") -> List[Dict[str, Any]]:
     """
     Align Gemma 2 chapters with Whisper segments to get timestamps for each chapter.
     
     Args:
         gemma_chapters: List of chapters from Gemma 2 with chapterNumber, title, and content
         whisper_segments: List of Whisper segments with start, end, and text
+        backend: "shingle" (n-gram index, one pass) or "difflib" (SequenceMatcher per segment)
     
     Returns:
         List of chapters with start and end timestamps
     """
     aligned_chapters = []
     current_segment_idx = 0
+    index = ShingleIndex(whisper_segments) if backend == "shingle" else None
     
     for chapter in gemma_chapters:
         chapter_content = chapter["content"]
         
         # Find matching segments for this chapter
-        start_idx, end_idx = find_segment_indices(
-            chapter_content, 
-            whisper_segments[current_segment_idx:]
-        )
+        if index is not None:
+            start_idx, end_idx, _ = index.find_span(
+                chapter_content,
+                index.segment_first_token[min(current_segment_idx, len(whisper_segments))]
+            )
+        else:
+            start_idx, end_idx = find_segment_indices(
+                chapter_content, 
+                whisper_segments[current_segment_idx:]
+            )
+            if start_idx is not None and end_idx is not None:
+                # Adjust indices based on current_segment_idx
+                start_idx += current_segment_idx
+                end_idx += current_segment_idx
         
         if start_idx is not None and end_idx is not None:
-            # Adjust indices based on current_segment_idx
-            start_idx += current_segment_idx
-            end_idx += current_segment_idx
-            
             # Get timestamps
             start_time = whisper_segments[start_idx]["start"]
             end_time = whisper_segments[end_idx]["end"]
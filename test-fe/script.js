@@ -3,6 +3,7 @@ const chaptersList = document.getElementById('chapters-list');
 const timelineMarkers = document.getElementById('timeline-markers');
 const videoUpload = document.getElementById('video-upload');
 const uploadButton = document.getElementById('upload-button');
+const transcriptList = document.getElementById('transcript');
 
 // // Fetch metadata from the backend
 // fetch('/api/get-metadata') // Adjust API endpoint as necessary
@@ -86,6 +87,9 @@ uploadButton.addEventListener('click', () => {
     if (file) {
         // Show loader
         document.getElementById('loader').style.display = 'block';
+        transcriptList.innerHTML = '';
+        chaptersList.querySelectorAll('li').forEach(li => li.remove());
+        timelineMarkers.innerHTML = '';
         
         const formData = new FormData();
         formData.append('file', file);
@@ -95,47 +99,20 @@ uploadButton.addEventListener('click', () => {
         video.src = videoURL;
         video.load(); // Load the new video source
 
-        fetch('http://localhost:8000/api/media-analyzer/vid-to-text', {
+        // Stream the analysis so the transcript renders while Whisper is still decoding
+        fetch('http://localhost:8000/api/media-analyzer/vid-to-text/stream', {
             method: 'POST',
             body: formData
         })
-            .then(response => response.json())
-            .then(data => {
+            .then(response => {
+                if (!response.ok) {
+                    throw new Error(`Upload failed with status ${response.status}`);
+                }
+                return readEvents(response, handleEvent);
+            })
+            .then(() => {
                 // Hide loader
                 document.getElementById('loader').style.display = 'none';
-                console.log('Video uploaded successfully:', data);
-
-                const chapters = data.chapters.chapters;
-
-                // Add chapters to the side list
-                chapters.forEach((chapter, index) => {
-                    const li = document.createElement('li');
-                    li.textContent = chapter.title;
-                    li.addEventListener('click', () => {
-                        video.currentTime = timeToSeconds(chapter.startTime); // Jump to chapter start
-                    });
-                    chaptersList.appendChild(li);
-
-                    // Add markers to the video timeline
-                    const marker = document.createElement('div');
-                    const duration = video.duration || 0;
-                    marker.style.width = `${((timeToSeconds(chapter.endTime) - timeToSeconds(chapter.startTime)) / duration) * 100}%`;
-                    marker.classList.add('chapter-marker');
-                    timelineMarkers.appendChild(marker);
-                });
-
-                // Adjust markers once video metadata is loaded
-                video.addEventListener('loadedmetadata', () => {
-                    const duration = video.duration;
-                    timelineMarkers.innerHTML = ''; // Clear existing markers
-                    chapters.forEach(chapter => {
-                        const marker = document.createElement('div');
-                        marker.style.left = `${(timeToSeconds(chapter.startTime) / duration) * 100}%`;
-                        marker.style.width = `${((timeToSeconds(chapter.endTime) - timeToSeconds(chapter.startTime)) / duration) * 100}%`;
-                        marker.classList.add('chapter-marker');
-                        timelineMarkers.appendChild(marker);
-                    });
-                });
             })
             .catch(error => {
                 // Hide loader
@@ -148,7 +125,138 @@ uploadButton.addEventListener('click', () => {
 }); 
 
 
+// Read a Server-Sent Events stream from a fetch response
+async function readEvents(response, onEvent) {
+    const reader = response.body.getReader();
+    const decoder = new TextDecoder();
+    let buffer = '';
+
+    while (true) {
+        const { value, done } = await reader.read();
+        if (done) {
+            break;
+        }
+        buffer += decoder.decode(value, { stream: true });
+
+        let boundary;
+        while ((boundary = buffer.indexOf('\n\n')) !== -1) {
+            const frame = buffer.slice(0, boundary);
+            buffer = buffer.slice(boundary + 2);
+
+            let event = 'message';
+            let data = '';
+            frame.split('\n').forEach(line => {
+                if (line.startsWith('event: ')) {
+                    event = line.slice(7);
+                } else if (line.startsWith('data: ')) {
+                    data += line.slice(6);
+                }
+            });
+            onEvent(event, data ? JSON.parse(data) : null);
+        }
+    }
+}
+
+
+function handleEvent(event, data) {
+    switch (event) {
+        case 'segments':
+            // Whisper segments arrive window by window
+            data.forEach(segment => {
+                const li = document.createElement('li');
+                li.textContent = `[${formatTime(segment.start)}] ${segment.text.trim()}`;
+                li.addEventListener('click', () => {
+                    video.currentTime = segment.start;
+                });
+                transcriptList.appendChild(li);
+            });
+            break;
+        case 'chapter':
+            // single chapters arrive while the LLM is still generating
+            addChapterItem(data.chapter);
+            break;
+        case 'chapters':
+            if (data && data.chapters) {
+                // replace the streamed chapters with the final list; the loader lives in this list too
+                chaptersList.querySelectorAll('li').forEach(li => li.remove());
+                renderChapters(data.chapters);
+            }
+            break;
+        case 'alignedChapters':
+            // Whisper-accurate timestamps replace the LLM's estimates on the timeline
+            if (data && data.length) {
+                renderMarkers(data
+                    .filter(chapter => chapter.start !== null)
+                    .map(chapter => ({ start: chapter.start, end: chapter.end })));
+            }
+            break;
+        case 'result':
+            console.log('Video uploaded successfully:', data);
+            break;
+        case 'error':
+            console.error('Error analyzing video:', data);
+            break;
+    }
+}
+
+
+function renderChapters(chapters) {
+    // Add chapters to the side list
+    chapters.forEach(addChapterItem);
+
+    renderMarkers(chapters.map(chapter => ({
+        start: timeToSeconds(chapter.startTime),
+        end: timeToSeconds(chapter.endTime)
+    })));
+}
+
+
+function addChapterItem(chapter) {
+    const li = document.createElement('li');
+    li.textContent = chapter.title;
+    li.addEventListener('click', () => {
+        video.currentTime = timeToSeconds(chapter.startTime); // Jump to chapter start
+    });
+    chaptersList.appendChild(li);
+}
+
+
+function renderMarkers(ranges) {
+    const draw = () => {
+        const duration = video.duration;
+        timelineMarkers.innerHTML = ''; // Clear existing markers
+        ranges.forEach(range => {
+            const marker = document.createElement('div');
+            marker.style.left = `${(range.start / duration) * 100}%`;
+            marker.style.width = `${((range.end - range.start) / duration) * 100}%`;
+            marker.classList.add('chapter-marker');
+            timelineMarkers.appendChild(marker);
+        });
+    };
+
+    // Adjust markers once video metadata is loaded
+    if (video.duration) {
+        draw();
+    } else {
+        video.addEventListener('loadedmetadata', draw, { once: true });
+    }
+}
+
+
+function formatTime(seconds) {
+    const total = Math.floor(seconds);
+    const hours = Math.floor(total / 3600);
+    const minutes = Math.floor((total % 3600) / 60);
+    const secs = total % 60;
+    return [hours, minutes, secs].map(part => String(part).padStart(2, '0')).join(':');
+}
+
+
 function timeToSeconds(timeString) {
-    const [hours, minutes, seconds] = timeString.split(':').map(Number);
-    return (hours * 3600) + (minutes * 60) + seconds;
-}
\ No newline at end of file
+    if (!timeString) {
+        return 0;
+    }
+    const parts = String(timeString).split(':').map(Number);
+    // accepts HH:MM:SS as well as MM:SS
+    return parts.reduce((total, part) => total * 60 + part, 0);
+}